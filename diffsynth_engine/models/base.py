@@ -1,10 +1,11 @@
 import os
+import re
 import torch
 import torch.nn as nn
-from typing import Dict, Union, List, Any
+from typing import Dict, Union, List, Any, Optional, Tuple
 from diffsynth_engine.utils.loader import load_file
 from diffsynth_engine.models.basic.lora import LoRALinear, LoRAConv2d
-from diffsynth_engine.models.utils import no_init_weights
+from diffsynth_engine.utils.int8_linear import enable_int8_linear
 
 
 class StateDictConverter:
@@ -15,8 +16,21 @@ class StateDictConverter:
 class PreTrainedModel(nn.Module):
     converter = StateDictConverter()
 
-    def load_state_dict(self, state_dict: Dict[str, torch.Tensor], strict: bool = True, assign: bool = False):
+    def load_state_dict(
+        self,
+        state_dict: Dict[str, torch.Tensor],
+        strict: bool = True,
+        assign: bool = False,
+        device: Optional[str] = None,
+        dtype: Optional[torch.dtype] = None,
+    ):
         state_dict = self.converter.convert(state_dict)
+        if device is not None or dtype is not None:
+            # cast after conversion so that keys dropped by the converter are never moved
+            state_dict = {
+                key: param.to(device=device, dtype=dtype if torch.is_floating_point(param) else None, non_blocking=True)
+                for key, param in state_dict.items()
+            }
         super().load_state_dict(state_dict, strict=strict, assign=assign)
 
     @classmethod
@@ -26,17 +40,19 @@ class PreTrainedModel(nn.Module):
 
     @classmethod
     def from_state_dict(cls, state_dict: Dict[str, torch.Tensor], device: str, dtype: torch.dtype, **kwargs):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(cls, device=device, dtype=dtype, **kwargs)
-        model.to_empty(device=device)
-        model.load_state_dict(state_dict)
-        model.to(device=device, dtype=dtype, non_blocking=True)
+        # build under the meta device context so that layers which ignore the device kwarg are not allocated and
+        # initialized either, the state dict tensors are then assigned in place of the meta parameters
+        with torch.device("meta"):
+            model = cls(device="meta", dtype=dtype, **kwargs)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
 
     def load_loras(self, lora_args: List[Dict[str, Any]], fused: bool = True):
+        # build the name -> module map once instead of walking the module tree for every lora key
+        modules = dict(self.named_modules())
         for args in lora_args:
             key = args["name"]
-            module = self.get_submodule(key)
+            module = modules.get(key)
             if not isinstance(module, (LoRALinear, LoRAConv2d)):
                 raise ValueError(f"Unsupported lora key: {key}")
             if fused:
@@ -44,21 +60,20 @@ class PreTrainedModel(nn.Module):
             else:
                 module.add_lora(**args)
 
+    def quantize_linears_int8(self, exclude: Tuple[str, ...] = ()):
+        enable_int8_linear(self, exclude=exclude)
+
     def unload_loras(self):
         for module in self.modules():
             if isinstance(module, (LoRALinear, LoRAConv2d)):
                 module.clear()
 
 
+_SUFFIX_PATTERN = re.compile(r"^(.*?)(\.lora_up\.weight|\.lora_down\.weight|\.weight|\.bias|\.alpha)$")
+
+
 def split_suffix(name: str):
-    suffix_list = [
-        ".lora_up.weight",
-        ".lora_down.weight",
-        ".weight",
-        ".bias",
-        ".alpha",
-    ]
-    for suffix in suffix_list:
-        if name.endswith(suffix):
-            return name.replace(suffix, ""), suffix
-    return name, ""
+    match = _SUFFIX_PATTERN.match(name)
+    if match is None:
+        return name, ""
+    return match.group(1), match.group(2)
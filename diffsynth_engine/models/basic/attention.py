@@ -1,9 +1,12 @@
+import functools
+import inspect
+import weakref
 import torch
 import torch.nn as nn
-from einops import rearrange, repeat
-from typing import Optional
+from typing import Callable, Dict, Optional, Tuple
 
 import torch.nn.functional as F
+from torch.nn.attention import sdpa_kernel, SDPBackend
 from diffsynth_engine.utils import logging
 from diffsynth_engine.utils.flag import (
     FLASH_ATTN_3_AVAILABLE,
@@ -16,6 +19,9 @@ from diffsynth_engine.utils.flag import (
 
 logger = logging.get_logger(__name__)
 
+# fused attention kernels only take their fast path when head dim is a multiple of this
+_HEAD_DIM_ALIGN = 8
+
 
 def memory_align(x: torch.Tensor, dim=-1, alignment: int = 8):
     padding_size = (alignment - x.shape[dim] % alignment) % alignment
@@ -23,66 +29,241 @@ def memory_align(x: torch.Tensor, dim=-1, alignment: int = 8):
     return padded_x[..., : x.shape[dim]]
 
 
-if FLASH_ATTN_3_AVAILABLE:
+# (weakref to source mask, version, batch size, num heads, aligned mask) of the last xformers call
+_EMPTY_XFORMERS_MASK_CACHE = (None, None, None, None, None)
+_xformers_mask_cache = _EMPTY_XFORMERS_MASK_CACHE
+
+
+def _release_xformers_mask(mask_ref: weakref.ref):
+    # the aligned copy must not outlive the mask it was made from, e.g. after the encoder is offloaded
+    global _xformers_mask_cache
+    if _xformers_mask_cache[0] is mask_ref:
+        _xformers_mask_cache = _EMPTY_XFORMERS_MASK_CACHE
+
+
+def _prepare_xformers_mask(attn_mask: torch.Tensor, batch_size: int, num_heads: int):
+    # every layer of an encoder shares one mask, so the last broadcast and aligned mask is reused
+    global _xformers_mask_cache
+    mask_ref, version, cached_batch_size, cached_num_heads, aligned_mask = _xformers_mask_cache
+    if (
+        mask_ref is not None
+        and mask_ref() is attn_mask
+        and version == attn_mask._version
+        and cached_batch_size == batch_size
+        and cached_num_heads == num_heads
+    ):
+        return aligned_mask
+    aligned_mask = memory_align(attn_mask.expand(batch_size, num_heads, -1, -1))
+    mask_ref = weakref.ref(attn_mask, _release_xformers_mask)
+    _xformers_mask_cache = (mask_ref, attn_mask._version, batch_size, num_heads, aligned_mask)
+    return aligned_mask
+
+
+@functools.lru_cache(maxsize=None)
+def _fp8_attn_supported(device: torch.device) -> bool:
+    return device.type == "cuda" and torch.cuda.get_device_capability(device) >= (9, 0)
+
+
+def _quantize_fp8_per_head(x: torch.Tensor):
+    # x: [B, S, N, D], one scale per (batch, head) so that amax maps to the e4m3 max value
+    descale = x.abs().amax(dim=(1, 3)).float().clamp(min=1e-12) / torch.finfo(torch.float8_e4m3fn).max
+    x_fp8 = (x / descale[:, None, :, None].to(x.dtype)).to(torch.float8_e4m3fn)
+    return x_fp8, descale
+
+
+def _load_flash_attn_3():
+    from flash_attn_interface import flash_attn_func as flash_attn3
+
+    def flash_attn3_attn(q, k, v, attn_mask=None, scale=None):
+        return flash_attn3(q, k, v, softmax_scale=scale)
+
+    return flash_attn3_attn
+
+
+def _load_flash_attn_3_fp8():
     from flash_attn_interface import flash_attn_func as flash_attn3
-if FLASH_ATTN_2_AVAILABLE:
+
+    def flash_attn3_fp8_attn(q, k, v, attn_mask=None, scale=None):
+        if not _fp8_attn_supported(q.device):
+            raise RuntimeError("flash_attn_3_fp8 requires a Hopper (sm90) or newer GPU")
+        scale = 1 / q.shape[-1] ** 0.5 if scale is None else scale
+        q_fp8, q_descale = _quantize_fp8_per_head(q)
+        k_fp8, k_descale = _quantize_fp8_per_head(k)
+        v_fp8, v_descale = _quantize_fp8_per_head(v)
+        out = flash_attn3(
+            q_fp8,
+            k_fp8,
+            v_fp8,
+            softmax_scale=scale,
+            q_descale=q_descale,
+            k_descale=k_descale,
+            v_descale=v_descale,
+        )
+        return out.to(q.dtype)
+
+    return flash_attn3_fp8_attn
+
+
+def _load_flash_attn_2():
     from flash_attn import flash_attn_func as flash_attn2
-if XFORMERS_AVAILABLE:
+
+    def flash_attn2_attn(q, k, v, attn_mask=None, scale=None):
+        return flash_attn2(q, k, v, softmax_scale=scale)
+
+    return flash_attn2_attn
+
+
+def _load_xformers():
     from xformers.ops import memory_efficient_attention
 
     def xformers_attn(q, k, v, attn_mask=None, scale=None):
         if attn_mask is not None:
-            attn_mask = repeat(attn_mask, "S L -> B H S L", B=q.shape[0], H=q.shape[2])
-            attn_mask = memory_align(attn_mask)
+            attn_mask = _prepare_xformers_mask(attn_mask, q.shape[0], q.shape[2])
         return memory_efficient_attention(q, k, v, attn_bias=attn_mask, scale=scale)
 
+    return xformers_attn
 
-if SDPA_AVAILABLE:
 
-    def sdpa_attn(q, k, v, attn_mask=None, scale=None):
-        q = q.transpose(1, 2)
-        k = k.transpose(1, 2)
-        v = v.transpose(1, 2)
-        out = torch.nn.functional.scaled_dot_product_attention(q, k, v, attn_mask=attn_mask, scale=scale)
-        return out.transpose(1, 2)
+def sdpa_attn(q, k, v, attn_mask=None, scale=None):
+    q = q.transpose(1, 2)
+    k = k.transpose(1, 2)
+    v = v.transpose(1, 2)
+    out = F.scaled_dot_product_attention(q, k, v, attn_mask=attn_mask, scale=scale)
+    return out.transpose(1, 2)
+
+
+# pytorch >= 2.6 can treat the backend list as a priority order and fall back, older versions only use the listed ones
+_SDPA_SET_PRIORITY = "set_priority" in inspect.signature(sdpa_kernel).parameters
+
+
+def cudnn_attn(q, k, v, attn_mask=None, scale=None):
+    if _SDPA_SET_PRIORITY:
+        backends = [
+            SDPBackend.CUDNN_ATTENTION,
+            SDPBackend.FLASH_ATTENTION,
+            SDPBackend.EFFICIENT_ATTENTION,
+            SDPBackend.MATH,
+        ]
+        with sdpa_kernel(backends, set_priority=True):
+            return sdpa_attn(q, k, v, attn_mask=attn_mask, scale=scale)
+    with sdpa_kernel(SDPBackend.CUDNN_ATTENTION):
+        return sdpa_attn(q, k, v, attn_mask=attn_mask, scale=scale)
+
 
+def _cudnn_attn_preferred() -> bool:
+    # cuDNN attention is the fastest SDPA kernel on sm90+, only pick it automatically when it can fall back
+    return (
+        SDPA_AVAILABLE
+        and _SDPA_SET_PRIORITY
+        and torch.cuda.is_available()
+        and torch.cuda.get_device_capability() >= (9, 0)
+    )
 
-if SAGE_ATTN_AVAILABLE:
+
+def _load_sage_attn():
     from sageattention import sageattn
 
     def sage_attn(q, k, v, attn_mask=None, scale=None):
-        q = q.transpose(1, 2)
-        k = k.transpose(1, 2)
-        v = v.transpose(1, 2)
-        out = sageattn(q, k, v, attn_mask=attn_mask, sm_scale=scale)
-        return out.transpose(1, 2)
+        # sageattn reads [B, S, N, D] directly with NHD layout, no transpose needed
+        return sageattn(q, k, v, tensor_layout="NHD", attn_mask=attn_mask, sm_scale=scale)
+
+    return sage_attn
 
 
-if SPARGE_ATTN_AVAILABLE:
+def _load_sparge_attn():
     from spas_sage_attn import spas_sage2_attn_meansim_cuda
 
-    def sparge_attn(self, q, k, v, attn_mask=None, scale=None):
+    def sparge_attn(q, k, v, attn_mask=None, scale=None):
         q = q.transpose(1, 2)
         k = k.transpose(1, 2)
         v = v.transpose(1, 2)
         out = spas_sage2_attn_meansim_cuda(q, k, v, attn_mask=attn_mask, scale=scale)
         return out.transpose(1, 2)
 
+    return sparge_attn
+
 
 def eager_attn(q, k, v, attn_mask=None, scale=None):
+    """
+    Reference attention. "eager" is served by SDPA's math backend, the same scale, matmul, mask and softmax
+    sequence as the former hand-written ops, only inside a single aten call, so the results can differ from older
+    releases in the last bits but no fused kernel is involved. The one exception is fp32 cuda input with
+    torch.set_float32_matmul_precision("medium"): the math backend would keep the gemms in fp32, there they run
+    in bf16 on tensor cores with the scale and mask folded into the qk^T gemm, while the softmax stays in fp32.
+    """
     q = q.transpose(1, 2)
     k = k.transpose(1, 2)
     v = v.transpose(1, 2)
+    if not (q.is_cuda and q.dtype == torch.float32 and torch.get_float32_matmul_precision() == "medium"):
+        with sdpa_kernel(SDPBackend.MATH):
+            out = F.scaled_dot_product_attention(q, k, v, attn_mask=attn_mask, scale=scale)
+        return out.transpose(1, 2)
     scale = 1 / q.shape[-1] ** 0.5 if scale is None else scale
-    q = q * scale
-    attn = torch.matmul(q, k.transpose(-2, -1))
-    if attn_mask is not None:
-        attn = attn + attn_mask
-    attn = attn.softmax(-1)
-    out = attn @ v
+    batch_size, num_heads, q_len, k_len = q.shape[0], q.shape[1], q.shape[2], k.shape[2]
+    q = q.reshape(batch_size * num_heads, q_len, -1).bfloat16()
+    k = k.reshape(batch_size * num_heads, k_len, -1).bfloat16()
+    v = v.reshape(batch_size * num_heads, k_len, -1).bfloat16()
+    if attn_mask is None:
+        attn = torch.bmm(q, k.transpose(1, 2)).mul_(scale)
+    else:
+        if attn_mask.dim() > 2:
+            attn_mask = attn_mask.expand(batch_size, num_heads, q_len, k_len).reshape(-1, q_len, k_len)
+        attn = torch.baddbmm(attn_mask.to(q.dtype), q, k.transpose(1, 2), alpha=scale)
+    attn = attn.float().softmax(-1).to(v.dtype)
+    out = torch.bmm(attn, v).float().view(batch_size, num_heads, q_len, -1)
     return out.transpose(1, 2)
 
 
+def align_head_dim(attn_func: Callable, alignment: int = _HEAD_DIM_ALIGN) -> Callable:
+    """
+    Zero-pad the head dim of q/k/v up to a multiple of `alignment` so that fused kernels take their aligned
+    fast path, then slice the output back. Zero padding does not change q @ k^T, only the default scale,
+    which is computed from the original head dim.
+    """
+
+    def aligned_attn_func(q, k, v, attn_mask=None, scale=None):
+        qk_dim, v_dim = q.shape[-1], v.shape[-1]
+        if qk_dim % alignment == 0 and v_dim % alignment == 0:
+            return attn_func(q, k, v, attn_mask=attn_mask, scale=scale)
+        scale = 1 / qk_dim**0.5 if scale is None else scale
+        qk_pad, v_pad = (-qk_dim) % alignment, (-v_dim) % alignment
+        q, k, v = F.pad(q, (0, qk_pad)), F.pad(k, (0, qk_pad)), F.pad(v, (0, v_pad))
+        out = attn_func(q, k, v, attn_mask=attn_mask, scale=scale)
+        return out[..., :v_dim]
+
+    return aligned_attn_func
+
+
+# name -> (available, loader, needs head dim alignment), kernels are only imported when a backend is first requested
+_ATTN_BACKENDS: Dict[str, Tuple[bool, Callable[[], Callable], bool]] = {
+    "eager": (True, lambda: eager_attn, False),
+    "flash_attn_3": (FLASH_ATTN_3_AVAILABLE, _load_flash_attn_3, True),
+    "flash_attn_3_fp8": (FLASH_ATTN_3_AVAILABLE, _load_flash_attn_3_fp8, True),
+    "flash_attn_2": (FLASH_ATTN_2_AVAILABLE, _load_flash_attn_2, True),
+    "xformers": (XFORMERS_AVAILABLE, _load_xformers, True),
+    "sdpa": (SDPA_AVAILABLE, lambda: sdpa_attn, False),
+    "cudnn_attn": (SDPA_AVAILABLE, lambda: cudnn_attn, False),
+    "sage_attn": (SAGE_ATTN_AVAILABLE, _load_sage_attn, True),
+    "sparge_attn": (SPARGE_ATTN_AVAILABLE, _load_sparge_attn, True),
+}
+_AUTO_BACKEND_PRIORITY = ["flash_attn_3", "cudnn_attn", "flash_attn_2", "xformers", "sdpa", "eager"]
+
+
+@functools.lru_cache(maxsize=None)
+def get_attn_func(attn_impl: Optional[str] = None) -> Callable:
+    if attn_impl is None or attn_impl == "auto":
+        attn_impl = next(
+            name
+            for name in _AUTO_BACKEND_PRIORITY
+            if _ATTN_BACKENDS[name][0] and (name != "cudnn_attn" or _cudnn_attn_preferred())
+        )
+    available, loader, needs_alignment = _ATTN_BACKENDS.get(attn_impl, (False, None, False))
+    if not available:
+        raise ValueError(f"Invalid or unavailable attention implementation: {attn_impl}")
+    attn_func = loader()
+    return align_head_dim(attn_func) if needs_alignment else attn_func
+
+
 def attention(
     q,
     k,
@@ -96,45 +277,15 @@ def attention(
     k: [B, Lk, Nk, C1]
     v: [B, Lk, Nk, C2]
     """
-    assert attn_impl in [
-        None,
-        "auto",
-        "eager",
-        "flash_attn_2",
-        "flash_attn_3",
-        "xformers",
-        "sdpa",
-        "sage_attn",
-        "sparge_attn",
-    ]
-    if attn_impl is None or attn_impl == "auto":
-        if FLASH_ATTN_3_AVAILABLE:
-            return flash_attn3(q, k, v, softmax_scale=scale)
-        elif FLASH_ATTN_2_AVAILABLE:
-            return flash_attn2(q, k, v, softmax_scale=scale)
-        elif XFORMERS_AVAILABLE:
-            return xformers_attn(q, k, v, attn_mask=attn_mask, scale=scale)
-        elif SDPA_AVAILABLE:
-            return sdpa_attn(q, k, v, attn_mask=attn_mask, scale=scale)
-        else:
-            return eager_attn(q, k, v, attn_mask=attn_mask, scale=scale)
-    else:
-        if attn_impl == "eager":
-            return eager_attn(q, k, v, attn_mask=attn_mask, scale=scale)
-        elif attn_impl == "flash_attn_3":
-            return flash_attn3(q, k, v, softmax_scale=scale)
-        elif attn_impl == "flash_attn_2":
-            return flash_attn2(q, k, v, softmax_scale=scale)
-        elif attn_impl == "xformers":
-            return xformers_attn(q, k, v, attn_mask=attn_mask, scale=scale)
-        elif attn_impl == "sdpa":
-            return sdpa_attn(q, k, v, attn_mask=attn_mask, scale=scale)
-        elif attn_impl == "sage_attn":
-            return sage_attn(q, k, v, attn_mask=attn_mask, scale=scale)
-        elif attn_impl == "sparge_attn":
-            return sparge_attn(q, k, v, attn_mask=attn_mask, scale=scale)
-        else:
-            raise ValueError(f"Invalid attention implementation: {attn_impl}")
+    return get_attn_func(attn_impl)(q, k, v, attn_mask=attn_mask, scale=scale)
+
+
+def _fuse_qkv_state_dict_hook(module, state_dict, prefix, *args, **kwargs):
+    # checkpoints store to_q/to_k/to_v separately, concatenate them into to_qkv on load
+    for suffix in ("weight", "bias"):
+        keys = [f"{prefix}to_{name}.{suffix}" for name in ("q", "k", "v")]
+        if all(key in state_dict for key in keys):
+            state_dict[f"{prefix}to_qkv.{suffix}"] = torch.cat([state_dict.pop(key) for key in keys], dim=0)
 
 
 class Attention(nn.Module):
@@ -148,21 +299,30 @@ class Attention(nn.Module):
         bias_kv=False,
         bias_out=False,
         scale=None,
+        fuse_qkv: bool = False,
         attn_impl: Optional[str] = None,
         device: str = "cuda:0",
         dtype: torch.dtype = torch.float16,
     ):
         super().__init__()
         dim_inner = head_dim * num_heads
-        kv_dim = kv_dim if kv_dim is not None else q_dim
         self.num_heads = num_heads
         self.head_dim = head_dim
+        # fused projection only applies to self-attention with matching q/kv bias, and it replaces
+        # to_q/to_k/to_v by a single to_qkv, so it should not be used on modules targeted by LoRA
+        self.fuse_qkv = fuse_qkv and kv_dim in (None, q_dim) and bias_q == bias_kv
 
-        self.to_q = nn.Linear(q_dim, dim_inner, bias=bias_q, device=device, dtype=dtype)
-        self.to_k = nn.Linear(kv_dim, dim_inner, bias=bias_kv, device=device, dtype=dtype)
-        self.to_v = nn.Linear(kv_dim, dim_inner, bias=bias_kv, device=device, dtype=dtype)
+        if self.fuse_qkv:
+            self.to_qkv = nn.Linear(q_dim, 3 * dim_inner, bias=bias_q, device=device, dtype=dtype)
+            self.register_load_state_dict_pre_hook(_fuse_qkv_state_dict_hook)
+        else:
+            kv_dim = kv_dim if kv_dim is not None else q_dim
+            self.to_q = nn.Linear(q_dim, dim_inner, bias=bias_q, device=device, dtype=dtype)
+            self.to_k = nn.Linear(kv_dim, dim_inner, bias=bias_kv, device=device, dtype=dtype)
+            self.to_v = nn.Linear(kv_dim, dim_inner, bias=bias_kv, device=device, dtype=dtype)
         self.to_out = nn.Linear(dim_inner, q_dim, bias=bias_out, device=device, dtype=dtype)
         self.attn_impl = attn_impl
+        self.attn_func = get_attn_func(attn_impl)
         self.scale = scale
 
     def forward(
@@ -171,16 +331,45 @@ class Attention(nn.Module):
         y: Optional[torch.Tensor] = None,
         attn_mask: Optional[torch.Tensor] = None,
     ):
-        if y is None:
-            y = x
-        q = rearrange(self.to_q(x), "b s (n d) -> b s n d", n=self.num_heads)
-        k = rearrange(self.to_k(y), "b s (n d) -> b s n d", n=self.num_heads)
-        v = rearrange(self.to_v(y), "b s (n d) -> b s n d", n=self.num_heads)
-        out = attention(q, k, v, attn_mask=attn_mask, attn_impl=self.attn_impl, scale=self.scale)
-        out = rearrange(out, "b s n d -> b s (n d)", n=self.num_heads)
+        batch_size, seq_len = x.shape[:2]
+        if self.fuse_qkv:
+            assert y is None, "fused qkv projection only supports self-attention"
+            qkv = self.to_qkv(x).view(batch_size, seq_len, 3, self.num_heads, self.head_dim)
+            q, k, v = qkv.unbind(2)
+        else:
+            if y is None:
+                y = x
+            kv_len = y.shape[1]
+            q = self.to_q(x).view(batch_size, seq_len, self.num_heads, self.head_dim)
+            k = self.to_k(y).view(batch_size, kv_len, self.num_heads, self.head_dim)
+            v = self.to_v(y).view(batch_size, kv_len, self.num_heads, self.head_dim)
+        out = self.attn_func(q, k, v, attn_mask=attn_mask, scale=self.scale)
+        out = out.reshape(batch_size, seq_len, self.num_heads * self.head_dim)
         return self.to_out(out)
 
 
+def _get_long_attn(attn_type):
+    from yunchang.globals import PROCESS_GROUP
+
+    # LongContextAttention captures the sequence parallel groups when it is built, a layer built for process groups
+    # that have been torn down and created again must not be reused
+    return _build_long_attn(attn_type, PROCESS_GROUP.ULYSSES_PG, PROCESS_GROUP.RING_PG)
+
+
+@functools.lru_cache(maxsize=8)
+def _build_long_attn(attn_type, ulysses_pg, ring_pg):
+    from yunchang import LongContextAttention
+
+    return LongContextAttention(attn_type=attn_type)
+
+
+def clear_long_attn_cache():
+    """
+    Drop the cached long context attention layers, call it when the parallel process groups are destroyed.
+    """
+    _build_long_attn.cache_clear()
+
+
 def long_context_attention(
     q,
     k,
@@ -194,7 +383,6 @@ def long_context_attention(
     k: [B, Lk, Nk, C1]
     v: [B, Lk, Nk, C2]
     """
-    from yunchang import LongContextAttention
     from yunchang.kernels import AttnType
 
     assert attn_impl in [
@@ -210,24 +398,24 @@ def long_context_attention(
     ]
     if attn_impl is None or attn_impl == "auto":
         if FLASH_ATTN_3_AVAILABLE:
-            attn_func = LongContextAttention(attn_type=AttnType.FA3)
+            attn_func = _get_long_attn(AttnType.FA3)
         elif FLASH_ATTN_2_AVAILABLE:
-            attn_func = LongContextAttention(attn_type=AttnType.FA)
+            attn_func = _get_long_attn(AttnType.FA)
         elif SDPA_AVAILABLE:
-            attn_func = LongContextAttention(attn_type=AttnType.TORCH)
+            attn_func = _get_long_attn(AttnType.TORCH)
         else:
             raise ValueError("No available long context attention implementation")
     else:
         if attn_impl == "flash_attn_3":
-            attn_func = LongContextAttention(attn_type=AttnType.FA3)
+            attn_func = _get_long_attn(AttnType.FA3)
         elif attn_impl == "flash_attn_2":
-            attn_func = LongContextAttention(attn_type=AttnType.FA)
+            attn_func = _get_long_attn(AttnType.FA)
         elif attn_impl == "sdpa":
-            attn_func = LongContextAttention(attn_type=AttnType.TORCH)
+            attn_func = _get_long_attn(AttnType.TORCH)
         elif attn_impl == "sage_attn":
-            attn_func = LongContextAttention(attn_type=AttnType.SAGE_FP8)
+            attn_func = _get_long_attn(AttnType.SAGE_FP8)
         elif attn_impl == "sparge_attn":
-            attn_func = LongContextAttention(attn_type=AttnType.SPARSE_SAGE)
+            attn_func = _get_long_attn(AttnType.SPARSE_SAGE)
         else:
             raise ValueError(f"Invalid long context attention implementation: {attn_impl}")
     return attn_func(q, k, v, softmax_scale=scale)
@@ -1,3 +1,4 @@
+import functools
 import torch
 import torch.nn as nn
 from torch.nn.common_types import _size_2_t
@@ -5,6 +6,20 @@ from typing import Union
 from collections import OrderedDict
 from contextlib import contextmanager
 
+from diffsynth_engine.utils import logging
+
+logger = logging.get_logger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def _warn_inexact_unmerge(dtype: torch.dtype):
+    # once per dtype, not once for each of the hundreds of LoRA layers of a model
+    logger.warning(
+        f"Unloading LoRAs merged without save_original_weight from {dtype} weights, subtracting them again "
+        "rounds the weights a second time and they drift from the original ones, "
+        "pass save_original_weight=True to restore them exactly"
+    )
+
 
 class LoRA(nn.Module):
     def __init__(
@@ -31,11 +46,15 @@ class LoRA(nn.Module):
             return self.scale * (self.alpha / self.rank) * (x @ self.down.T @ self.up.T)
         return self.scale * (self.alpha / self.rank) * (self.up(self.down(x)))
 
-    def apply_to(self, w: Union[nn.Linear, nn.Conv2d, nn.Parameter, torch.Tensor]):
+    def apply_to(self, w: Union[nn.Linear, nn.Conv2d, nn.Parameter, torch.Tensor], sign: float = 1.0):
+        """
+        Merge scale * alpha / rank * up @ down into w, sign=-1 removes a previously merged LoRA again.
+        up @ down is accumulated in fp32 so that the merged weight does not lose more precision than one rounding.
+        """
         if isinstance(self.up, torch.Tensor) and isinstance(self.down, torch.Tensor):
-            delta_w = self.scale * (self.alpha / self.rank) * (self.up @ self.down)
+            delta_w = sign * self.scale * (self.alpha / self.rank) * (self.up.float() @ self.down.float())
         else:
-            delta_w = self.scale * (self.alpha / self.rank) * (self.up.weight @ self.down.weight)
+            delta_w = sign * self.scale * (self.alpha / self.rank) * (self.up.weight.float() @ self.down.weight.float())
         if isinstance(w, (nn.Linear, nn.Conv2d)):
             delta_w = delta_w.to(device=w.weight.data.device, dtype=w.weight.data.dtype)
             w.weight.data.add_(delta_w)
@@ -124,10 +143,13 @@ class LoRALinear(nn.Linear):
         self._frozen_lora_list.append(lora)
 
     def clear(self):
-        if self._original_weight is None and len(self._frozen_lora_list) > 0:
-            raise RuntimeError(
-                "Current LoRALinear has patched by frozen LoRA, but original weight is not saved, so you cannot clear LoRA."
-            )
+        if self._original_weight is None:
+            # original weight is not saved, subtract the merged LoRAs again in reverse order, this is only exact up to
+            # fp32 rounding
+            if len(self._frozen_lora_list) > 0 and self.weight.dtype != torch.float32:
+                _warn_inexact_unmerge(self.weight.dtype)
+            for lora in reversed(self._frozen_lora_list):
+                lora.apply_to(self, sign=-1.0)
         self._lora_dict.clear()
         self._frozen_lora_list = []
         if self._original_weight is not None:
@@ -264,10 +286,13 @@ class LoRAConv2d(nn.Conv2d):
         self._frozen_lora_list.append(lora)
 
     def clear(self):
-        if self._original_weight is None and len(self._frozen_lora_list) > 0:
-            raise RuntimeError(
-                "Current LoRALinear has patched by frozen LoRA, but original weight is not saved, so you cannot clear LoRA."
-            )
+        if self._original_weight is None:
+            # original weight is not saved, subtract the merged LoRAs again in reverse order, this is only exact up to
+            # fp32 rounding
+            if len(self._frozen_lora_list) > 0 and self.weight.dtype != torch.float32:
+                _warn_inexact_unmerge(self.weight.dtype)
+            for lora in reversed(self._frozen_lora_list):
+                lora.apply_to(self, sign=-1.0)
         self._lora_dict.clear()
         self._frozen_lora_list = []
         if self._original_weight is not None:
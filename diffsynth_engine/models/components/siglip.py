@@ -26,7 +26,7 @@ class SiglipVisionEmbeddings(nn.Module):
             dtype=dtype,
         )
         self.position_embedding = nn.Embedding(num_positions, hidden_size, device=device, dtype=dtype)
-        self.position_ids = torch.arange(num_positions).expand((1, -1))
+        self.position_ids = torch.arange(num_positions, device="cpu").expand((1, -1))
 
     def forward(self, pixel_values: torch.FloatTensor, interpolate_pos_encoding=False) -> torch.Tensor:
         target_dtype = self.patch_embedding.weight.dtype
@@ -7,7 +7,6 @@ from typing import Dict
 from diffsynth_engine.models.basic.attention import Attention
 from diffsynth_engine.models.basic.unet_helper import ResnetBlock, UpSampler, DownSampler
 from diffsynth_engine.models.base import PreTrainedModel, StateDictConverter
-from diffsynth_engine.models.utils import no_init_weights
 from diffsynth_engine.utils.constants import VAE_CONFIG_FILE
 from diffsynth_engine.utils import logging
 
@@ -87,6 +86,7 @@ class VAEAttentionBlock(nn.Module):
                     bias_q=True,
                     bias_kv=True,
                     bias_out=True,
+                    fuse_qkv=True,
                     attn_impl=attn_impl,
                     device=device,
                     dtype=dtype,
@@ -207,18 +207,17 @@ class VAEDecoder(PreTrainedModel):
         use_post_quant_conv: bool = True,
         attn_impl: str = "auto",
     ):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(
-                cls,
+        with torch.device("meta"):
+            model = cls(
                 latent_channels=latent_channels,
                 scaling_factor=scaling_factor,
                 shift_factor=shift_factor,
                 use_post_quant_conv=use_post_quant_conv,
                 attn_impl=attn_impl,
-                device=device,
+                device="meta",
                 dtype=dtype,
             )
-        model.load_state_dict(state_dict)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
 
     @classmethod
@@ -317,18 +316,17 @@ class VAEEncoder(PreTrainedModel):
         use_quant_conv: bool = True,
         attn_impl: str = "auto",
     ):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(
-                cls,
+        with torch.device("meta"):
+            model = cls(
                 latent_channels=latent_channels,
                 scaling_factor=scaling_factor,
                 shift_factor=shift_factor,
                 use_quant_conv=use_quant_conv,
                 attn_impl=attn_impl,
-                device=device,
+                device="meta",
                 dtype=dtype,
             )
-        model.load_state_dict(state_dict)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
 
     @classmethod
@@ -389,17 +387,16 @@ class VAE(PreTrainedModel):
         use_post_quant_conv: bool = True,
         attn_impl: str = "auto",
     ):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(
-                cls,
+        with torch.device("meta"):
+            model = cls(
                 latent_channels=latent_channels,
                 scaling_factor=scaling_factor,
                 shift_factor=shift_factor,
                 use_quant_conv=use_quant_conv,
                 use_post_quant_conv=use_post_quant_conv,
                 attn_impl=attn_impl,
-                device=device,
+                device="meta",
                 dtype=dtype,
             )
-        model.load_state_dict(state_dict)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
@@ -8,7 +8,6 @@ from diffsynth_engine.models.flux.flux_dit import (
     RoPEEmbedding,
     TimestepEmbeddings,
 )
-from diffsynth_engine.models.utils import no_init_weights
 
 
 class FluxControlNetStateDictConverter(StateDictConverter):
@@ -134,8 +133,8 @@ class FluxControlNet(PreTrainedModel):
             hidden_states, prompt_emb = block(hidden_states, prompt_emb, condition, image_rotary_emb)
             double_block_outputs.append(self.blocks_proj[i](hidden_states))
 
-        # apply control scale
-        double_block_outputs = [control_scale * output for output in double_block_outputs]
+        # stack to (num_blocks, B, L, D) and apply control scale in one kernel
+        double_block_outputs = torch.stack(double_block_outputs) * control_scale
         return double_block_outputs, None
 
     @classmethod
@@ -151,10 +150,7 @@ class FluxControlNet(PreTrainedModel):
         else:
             condition_channels = 64
 
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(
-                cls, condition_channels=condition_channels, attn_impl=attn_impl, device=device, dtype=dtype
-            )
-        model.load_state_dict(state_dict)
-        model.to(device=device, dtype=dtype, non_blocking=True)
+        with torch.device("meta"):
+            model = cls(condition_channels=condition_channels, attn_impl=attn_impl, device="meta", dtype=dtype)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
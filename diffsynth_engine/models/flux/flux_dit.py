@@ -8,7 +8,6 @@ from einops import rearrange
 from diffsynth_engine.models.basic.transformer_helper import AdaLayerNorm, AdaLayerNormSingle, RoPEEmbedding, RMSNorm
 from diffsynth_engine.models.basic.timestep import TimestepEmbeddings
 from diffsynth_engine.models.base import PreTrainedModel, StateDictConverter
-from diffsynth_engine.models.utils import no_init_weights
 from diffsynth_engine.utils.gguf import gguf_inference
 from diffsynth_engine.utils.fp8_linear import fp8_inference
 from diffsynth_engine.utils.constants import FLUX_DIT_CONFIG_FILE
@@ -469,14 +468,12 @@ class FluxDiT(PreTrainedModel):
         dtype: torch.dtype,
         attn_impl: Optional[str] = None,
     ):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(
-                cls,
-                device=device,
+        with torch.device("meta"):
+            model = cls(
+                device="meta",
                 dtype=dtype,
                 attn_impl=attn_impl,
             )
-            model = model.requires_grad_(False)  # for loading gguf
-        model.load_state_dict(state_dict, assign=True)
-        model.to(device=device, dtype=dtype, non_blocking=True)
+        model = model.requires_grad_(False)  # for loading gguf
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
@@ -5,7 +5,6 @@ from typing import Dict
 from diffsynth_engine.models.sd import SDTextEncoder
 from diffsynth_engine.models.components.t5 import T5EncoderModel
 from diffsynth_engine.models.base import StateDictConverter
-from diffsynth_engine.models.utils import no_init_weights
 from diffsynth_engine.utils.constants import FLUX_TEXT_ENCODER_CONFIG_FILE
 from diffsynth_engine.utils import logging
 
@@ -61,10 +60,9 @@ class FluxTextEncoder1(SDTextEncoder):
     def from_state_dict(
         cls, state_dict: Dict[str, torch.Tensor], device: str, dtype: torch.dtype, vocab_size: int = 49408
     ):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(cls, device=device, dtype=dtype, vocab_size=vocab_size)
-        model.load_state_dict(state_dict)
-        model.to(device=device, dtype=dtype)
+        with torch.device("meta"):
+            model = cls(device="meta", dtype=dtype, vocab_size=vocab_size)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
 
 
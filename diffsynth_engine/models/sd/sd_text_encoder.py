@@ -5,7 +5,6 @@ from typing import Dict
 
 from diffsynth_engine.models.components.clip import CLIPEncoderLayer
 from diffsynth_engine.models.base import PreTrainedModel, StateDictConverter
-from diffsynth_engine.models.utils import no_init_weights
 from diffsynth_engine.utils.constants import SD_TEXT_ENCODER_CONFIG_FILE
 from diffsynth_engine.utils import logging
 
@@ -97,7 +96,7 @@ class SDTextEncoder(PreTrainedModel):
         self.final_layer_norm = nn.LayerNorm(embed_dim, device=device, dtype=dtype)
 
     def attention_mask(self, length):
-        mask = torch.empty(length, length)
+        mask = torch.empty(length, length, device="cpu")
         mask.fill_(float("-inf"))
         mask.triu_(1)
         return mask
@@ -127,10 +126,9 @@ class SDTextEncoder(PreTrainedModel):
         num_encoder_layers: int = 12,
         encoder_intermediate_size: int = 3072,
     ):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(
-                cls,
-                device=device,
+        with torch.device("meta"):
+            model = cls(
+                device="meta",
                 dtype=dtype,
                 embed_dim=embed_dim,
                 vocab_size=vocab_size,
@@ -138,5 +136,5 @@ class SDTextEncoder(PreTrainedModel):
                 num_encoder_layers=num_encoder_layers,
                 encoder_intermediate_size=encoder_intermediate_size,
             )
-        model.load_state_dict(state_dict)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
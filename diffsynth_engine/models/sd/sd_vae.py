@@ -2,7 +2,6 @@ import torch
 from typing import Dict
 
 from diffsynth_engine.models.components.vae import VAEDecoder, VAEEncoder
-from diffsynth_engine.models.utils import no_init_weights
 
 
 class SDVAEEncoder(VAEEncoder):
@@ -21,9 +20,9 @@ class SDVAEEncoder(VAEEncoder):
     def from_state_dict(
         cls, state_dict: Dict[str, torch.Tensor], device: str, dtype: torch.dtype, attn_impl: str = "auto"
     ):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(cls, device=device, dtype=dtype, attn_impl=attn_impl)
-        model.load_state_dict(state_dict)
+        with torch.device("meta"):
+            model = cls(device="meta", dtype=dtype, attn_impl=attn_impl)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
 
 
@@ -43,7 +42,7 @@ class SDVAEDecoder(VAEDecoder):
     def from_state_dict(
         cls, state_dict: Dict[str, torch.Tensor], device: str, dtype: torch.dtype, attn_impl: str = "auto"
     ):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(cls, device=device, dtype=dtype, attn_impl=attn_impl)
-        model.load_state_dict(state_dict)
+        with torch.device("meta"):
+            model = cls(device="meta", dtype=dtype, attn_impl=attn_impl)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
@@ -7,7 +7,6 @@ from einops import rearrange
 from diffsynth_engine.models.basic.timestep import TimestepEmbeddings
 from diffsynth_engine.models.basic.transformer_helper import AdaLayerNorm
 from diffsynth_engine.models.base import PreTrainedModel, StateDictConverter
-from diffsynth_engine.models.utils import no_init_weights
 from diffsynth_engine.utils.constants import SD3_DIT_CONFIG_FILE
 from diffsynth_engine.utils import logging
 
@@ -289,8 +288,7 @@ class SD3DiT(PreTrainedModel):
 
     @classmethod
     def from_state_dict(cls, state_dict: Dict[str, torch.Tensor], device: str, dtype: torch.dtype):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(cls, device=device, dtype=dtype)
-        model.load_state_dict(state_dict, assign=True)
-        model.to(device=device, dtype=dtype, non_blocking=True)
+        with torch.device("meta"):
+            model = cls(device="meta", dtype=dtype)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
@@ -2,7 +2,6 @@ import torch
 from typing import Dict
 
 from diffsynth_engine.models.components.vae import VAEDecoder, VAEEncoder
-from diffsynth_engine.models.utils import no_init_weights
 
 
 class SD3VAEEncoder(VAEEncoder):
@@ -18,9 +17,9 @@ class SD3VAEEncoder(VAEEncoder):
 
     @classmethod
     def from_state_dict(cls, state_dict: Dict[str, torch.Tensor], device: str, dtype: torch.dtype):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(cls, device=device, dtype=dtype)
-        model.load_state_dict(state_dict)
+        with torch.device("meta"):
+            model = cls(device="meta", dtype=dtype)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
 
 
@@ -37,7 +36,7 @@ class SD3VAEDecoder(VAEDecoder):
 
     @classmethod
     def from_state_dict(cls, state_dict: Dict[str, torch.Tensor], device: str, dtype: torch.dtype):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(cls, device=device, dtype=dtype)
-        model.load_state_dict(state_dict)
+        with torch.device("meta"):
+            model = cls(device="meta", dtype=dtype)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
@@ -5,7 +5,6 @@ from typing import Dict
 
 from diffsynth_engine.models.components.clip import CLIPEncoderLayer
 from diffsynth_engine.models.base import PreTrainedModel, StateDictConverter, split_suffix
-from diffsynth_engine.models.utils import no_init_weights
 from diffsynth_engine.utils.constants import SDXL_TEXT_ENCODER_CONFIG_FILE
 from diffsynth_engine.utils import logging
 
@@ -169,7 +168,7 @@ class SDXLTextEncoder(PreTrainedModel):
         # It does not include final_layer_norm.
 
     def attention_mask(self, length):
-        mask = torch.empty(length, length)
+        mask = torch.empty(length, length, device="cpu")
         mask.fill_(float("-inf"))
         mask.triu_(1)
         return mask
@@ -198,10 +197,9 @@ class SDXLTextEncoder(PreTrainedModel):
         num_encoder_layers: int = 11,
         encoder_intermediate_size: int = 3072,
     ):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(
-                cls,
-                device=device,
+        with torch.device("meta"):
+            model = cls(
+                device="meta",
                 dtype=dtype,
                 embed_dim=embed_dim,
                 vocab_size=vocab_size,
@@ -209,7 +207,7 @@ class SDXLTextEncoder(PreTrainedModel):
                 num_encoder_layers=num_encoder_layers,
                 encoder_intermediate_size=encoder_intermediate_size,
             )
-        model.load_state_dict(state_dict)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
 
 
@@ -262,7 +260,7 @@ class SDXLTextEncoder2(PreTrainedModel):
         self.text_projection = nn.Linear(embed_dim, embed_dim, bias=False, device=device, dtype=dtype)
 
     def attention_mask(self, length):
-        mask = torch.empty(length, length)
+        mask = torch.empty(length, length, device="cpu")
         mask.fill_(float("-inf"))
         mask.triu_(1)
         return mask
@@ -292,10 +290,9 @@ class SDXLTextEncoder2(PreTrainedModel):
         num_encoder_layers: int = 32,
         encoder_intermediate_size: int = 5120,
     ):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(
-                cls,
-                device=device,
+        with torch.device("meta"):
+            model = cls(
+                device="meta",
                 dtype=dtype,
                 embed_dim=embed_dim,
                 vocab_size=vocab_size,
@@ -303,5 +300,5 @@ class SDXLTextEncoder2(PreTrainedModel):
                 num_encoder_layers=num_encoder_layers,
                 encoder_intermediate_size=encoder_intermediate_size,
             )
-        model.load_state_dict(state_dict)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
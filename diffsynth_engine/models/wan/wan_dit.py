@@ -9,7 +9,6 @@ from einops import rearrange
 from diffsynth_engine.models.base import StateDictConverter, PreTrainedModel
 from diffsynth_engine.models.basic.attention import attention, long_context_attention
 from diffsynth_engine.models.basic.transformer_helper import RMSNorm
-from diffsynth_engine.models.utils import no_init_weights
 from diffsynth_engine.utils.constants import (
     WAN_DIT_1_3B_T2V_CONFIG_FILE,
     WAN_DIT_14B_I2V_CONFIG_FILE,
@@ -46,7 +45,7 @@ def precompute_freqs_cis_3d(dim: int, end: int = 1024, theta: float = 10000.0):
 
 def precompute_freqs_cis(dim: int, end: int = 1024, theta: float = 10000.0):
     # 1d rope precompute
-    freqs = 1.0 / (theta ** (torch.arange(0, dim, 2)[: (dim // 2)].double() / dim))
+    freqs = 1.0 / (theta ** (torch.arange(0, dim, 2, device="cpu")[: (dim // 2)].double() / dim))
     freqs = torch.outer(torch.arange(end, device=freqs.device), freqs)
     freqs_cis = torch.polar(torch.ones_like(freqs), freqs)  # complex64
     return freqs_cis
@@ -82,9 +81,9 @@ class SelfAttention(nn.Module):
     def forward(self, x, freqs):
         q, k, v = self.norm_q(self.q(x)), self.norm_k(self.k(x)), self.v(x)
         num_heads = q.shape[2] // self.head_dim
-        q = rearrange(q, "b s (n d) -> b s n d", n=num_heads)
-        k = rearrange(k, "b s (n d) -> b s n d", n=num_heads)
-        v = rearrange(v, "b s (n d) -> b s n d", n=num_heads)
+        q = q.unflatten(2, (num_heads, self.head_dim))
+        k = k.unflatten(2, (num_heads, self.head_dim))
+        v = v.unflatten(2, (num_heads, self.head_dim))
         if getattr(self, "use_usp", False):
             x = long_context_attention(
                 q=rope_apply(q, freqs),
@@ -139,15 +138,15 @@ class CrossAttention(nn.Module):
             ctx = y
         q, k, v = self.norm_q(self.q(x)), self.norm_k(self.k(ctx)), self.v(ctx)
         num_heads = q.shape[2] // self.head_dim
-        q = rearrange(q, "b s (n d) -> b s n d", n=num_heads)
-        k = rearrange(k, "b s (n d) -> b s n d", n=num_heads)
-        v = rearrange(v, "b s (n d) -> b s n d", n=num_heads)
+        q = q.unflatten(2, (num_heads, self.head_dim))
+        k = k.unflatten(2, (num_heads, self.head_dim))
+        v = v.unflatten(2, (num_heads, self.head_dim))
 
         x = attention(q, k, v, attn_impl=self.attn_impl).flatten(2)
         if self.has_image_input:
             k_img, v_img = self.norm_k_img(self.k_img(img)), self.v_img(img)
-            k_img = rearrange(k_img, "b s (n d) -> b s n d", n=num_heads)
-            v_img = rearrange(v_img, "b s (n d) -> b s n d", n=num_heads)
+            k_img = k_img.unflatten(2, (num_heads, self.head_dim))
+            v_img = v_img.unflatten(2, (num_heads, self.head_dim))
             y = attention(q, k_img, v_img, attn_impl=self.attn_impl).flatten(2)
             x = x + y
         return self.o(x)
@@ -382,7 +381,6 @@ class WanDiT(PreTrainedModel):
         model_type="1.3b-t2v",
         attn_impl: Optional[str] = None,
         use_usp=False,
-        assign=True,
     ):
         if model_type == "1.3b-t2v":
             config = json.load(open(WAN_DIT_1_3B_T2V_CONFIG_FILE, "r"))
@@ -392,13 +390,10 @@ class WanDiT(PreTrainedModel):
             config = json.load(open(WAN_DIT_14B_I2V_CONFIG_FILE, "r"))
         else:
             raise ValueError(f"Unsupported model type: {model_type}")
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(
-                cls, **config, device=device, dtype=dtype, attn_impl=attn_impl, use_usp=use_usp
-            )
-            model = model.requires_grad_(False)
-        model.load_state_dict(state_dict, assign=assign)
-        model.to(device=device, dtype=dtype)
+        with torch.device("meta"):
+            model = cls(**config, device="meta", dtype=dtype, attn_impl=attn_impl, use_usp=use_usp)
+        model = model.requires_grad_(False)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
 
     def get_tp_plan(self):
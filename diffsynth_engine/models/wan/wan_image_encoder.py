@@ -6,7 +6,6 @@ import torch.nn.functional as F
 import torchvision.transforms as T
 
 from diffsynth_engine.models.base import StateDictConverter, PreTrainedModel
-from diffsynth_engine.models.utils import no_init_weights
 from diffsynth_engine.models.basic.attention import attention
 
 
@@ -463,7 +462,10 @@ class WanImageEncoder(PreTrainedModel):
     def __init__(self, device: str = "cuda:0", dtype: torch.dtype = torch.bfloat16):
         super().__init__()
         # init model
-        self.model, self.transforms = clip_xlm_roberta_vit_h_14(dtype=torch.float32, device="cpu")
+        # _clip builds under its own device context, pass meta through so from_state_dict does not allocate on cpu
+        self.model, self.transforms = clip_xlm_roberta_vit_h_14(
+            dtype=torch.float32, device="meta" if device == "meta" else "cpu"
+        )
 
     def encode_image(self, videos):
         # preprocess
@@ -487,8 +489,7 @@ class WanImageEncoder(PreTrainedModel):
 
     @classmethod
     def from_state_dict(cls, state_dict, device, dtype):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(cls, device=device, dtype=dtype)
-        model.load_state_dict(state_dict, assign=True)
-        model.to(device=device, dtype=dtype, non_blocking=True)
+        with torch.device("meta"):
+            model = cls(device="meta", dtype=dtype)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
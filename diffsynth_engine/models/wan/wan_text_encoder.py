@@ -5,7 +5,6 @@ import torch.nn.functional as F
 from typing import Dict
 
 from diffsynth_engine.models.base import StateDictConverter, PreTrainedModel
-from diffsynth_engine.models.utils import no_init_weights
 from diffsynth_engine.utils.gguf import gguf_inference
 from diffsynth_engine.utils import logging
 
@@ -289,9 +288,8 @@ class WanTextEncoder(PreTrainedModel):
         device: str,
         dtype: torch.dtype,
     ):
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(cls, device=device, dtype=dtype)
-            model = model.requires_grad_(False)  # for loading gguf
-        model.load_state_dict(state_dict, assign=True)
-        model.to(device=device, dtype=dtype, non_blocking=True)
+        with torch.device("meta"):
+            model = cls(device="meta", dtype=dtype)
+        model = model.requires_grad_(False)  # for loading gguf
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
@@ -5,7 +5,6 @@ from einops import rearrange, repeat
 from tqdm import tqdm
 
 from diffsynth_engine.models.base import StateDictConverter, PreTrainedModel
-from diffsynth_engine.models.utils import no_init_weights
 
 CACHE_T = 2
 
@@ -553,8 +552,8 @@ class WanVideoVAE(PreTrainedModel):
             2.8251,
             1.9160,
         ]
-        self.mean = torch.tensor(mean)
-        self.std = torch.tensor(std)
+        self.mean = torch.tensor(mean, device="cpu")
+        self.std = torch.tensor(std, device="cpu")
         self.scale = [self.mean, 1.0 / self.std]
 
         # init model
@@ -563,10 +562,9 @@ class WanVideoVAE(PreTrainedModel):
 
     @classmethod
     def from_state_dict(cls, state_dict, device="cuda:0", dtype=torch.float32) -> "WanVideoVAE":
-        with no_init_weights():
-            model = torch.nn.utils.skip_init(cls, device=device, dtype=dtype)
-        model.load_state_dict(state_dict, assign=True)
-        model.to(device=device, dtype=dtype, non_blocking=True)
+        with torch.device("meta"):
+            model = cls(device="meta", dtype=dtype)
+        model.load_state_dict(state_dict, assign=True, device=device, dtype=dtype)
         return model
 
     def build_1d_mask(self, length, left_bound, right_bound, border_width):
@@ -111,17 +111,18 @@ class BasePipeline:
     @staticmethod
     def preprocess_image(image: Image.Image, mode="RGB") -> torch.Tensor:
         image = image.convert(mode)
-        image_array = np.array(image, dtype=np.float32)
+        # share the uint8 buffer with torch and normalize with a single float allocation
+        image_array = np.array(image, dtype=np.uint8)
         if len(image_array.shape) == 2:
             image_array = image_array[:, :, np.newaxis]
-        image = torch.Tensor((image_array / 255) * 2 - 1).permute(2, 0, 1).unsqueeze(0)
+        image = torch.from_numpy(image_array).float().div_(127.5).sub_(1).permute(2, 0, 1).unsqueeze(0)
         return image
 
     @staticmethod
     def preprocess_mask(image: Image.Image, mode="L") -> torch.Tensor:
         image = image.convert(mode)
-        image_array = np.array(image, dtype=np.float32)
-        image = torch.Tensor((image_array / 255)).unsqueeze(0).unsqueeze(0)
+        image_array = np.array(image, dtype=np.uint8)
+        image = torch.from_numpy(image_array).float().div_(255).unsqueeze(0).unsqueeze(0)
         # binary
         image[image < 0.5] = 0
         image[image >= 0.5] = 1
@@ -3,7 +3,9 @@ import os
 import torch
 import torch.nn as nn
 import math
-from typing import Callable, Dict, List, Optional, Union
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
 from tqdm import tqdm
 from PIL import Image
 from dataclasses import dataclass
@@ -28,6 +30,86 @@ from diffsynth_engine.utils.download import fetch_model
 
 logger = logging.get_logger(__name__)
 
+# image_ids / text_ids / guidance entries kept by FluxImagePipeline.prepare_extra_input
+EXTRA_INPUT_CACHE_SIZE = 16
+
+_KOHYA_DIGIT_SUFFIX = re.compile(r"(\d+)_")
+_KOHYA_DIGIT_PREFIX = re.compile(r"_(\d+)")
+_KOHYA_DIT_REPLACEMENTS = {
+    "modulation_lin": "modulation.lin",
+    "mod_lin": "mod.lin",
+    "attn_qkv": "attn.qkv",
+    "attn_proj": "attn.proj",
+    ".alpha": ".weight",
+}
+_KOHYA_TE_REPLACEMENTS = {
+    "lora_te1": "text_encoder",
+    "text_model_encoder_layers": "text_model.encoder.layers",
+    ".alpha": ".weight",
+}
+_DIFFUSERS_SINGLE_REPLACEMENTS = {
+    "single_transformer_blocks": "single_blocks",
+    "norm.linear": "modulation.lin",
+    "proj_out": "linear2",
+    "attn": "linear1",  # linear1 = [to_q, to_k, to_v, mlp]
+    "proj_mlp": "linear1.mlp",
+}
+_DIFFUSERS_DOUBLE_REPLACEMENTS = {
+    "transformer_blocks": "double_blocks",
+    "attn.add_k_proj": "txt_attn.qkv.to_k",
+    "attn.add_q_proj": "txt_attn.qkv.to_q",
+    "attn.add_v_proj": "txt_attn.qkv.to_v",
+    "attn.to_add_out": "txt_attn.qkv.to_out",
+    "attn.to_k": "img_attn.qkv.to_k",
+    "attn.to_q": "img_attn.qkv.to_q",
+    "attn.to_v": "img_attn.qkv.to_v",
+    "attn.to_out": "img_attn.qkv.to_out",
+    "ff.net": "img_mlp",
+    "ff_context.net": "txt_mlp",
+    "norm1.linear": "img_mod.lin",
+    "norm1_context.linear": "txt_mod.lin",
+    ".0.proj": ".0",
+}
+_DIFFUSERS_TIME_TEXT_REPLACEMENTS = {
+    "time_text_embed.": "",
+    "timestep_embedder": "time_in",
+    "guidance_embedder": "guidance_in",
+    "text_embedder": "vector_in",
+    "linear_1": "in_layer",
+    "linear_2": "out_layer",
+}
+
+
+def _replacement_pattern(replacements: Dict[str, str]) -> re.Pattern:
+    # longest first, so a key is never shadowed by a shorter alternative matching at the same position
+    return re.compile("|".join(map(re.escape, sorted(replacements, key=len, reverse=True))))
+
+
+def _replace_all(pattern: re.Pattern, replacements: Dict[str, str], key: str) -> str:
+    # no replacement produces another source key, so one alternation pass matches the chained str.replace
+    return pattern.sub(lambda m: replacements[m.group(0)], key)
+
+
+_KOHYA_DIT_PATTERN = _replacement_pattern(_KOHYA_DIT_REPLACEMENTS)
+_KOHYA_TE_PATTERN = _replacement_pattern(_KOHYA_TE_REPLACEMENTS)
+_DIFFUSERS_SINGLE_PATTERN = _replacement_pattern(_DIFFUSERS_SINGLE_REPLACEMENTS)
+_DIFFUSERS_DOUBLE_PATTERN = _replacement_pattern(_DIFFUSERS_DOUBLE_REPLACEMENTS)
+_DIFFUSERS_TIME_TEXT_PATTERN = _replacement_pattern(_DIFFUSERS_TIME_TEXT_REPLACEMENTS)
+
+
+_LORA_SUFFIXES = ((".alpha", "alpha"), (".lora_up.weight", "up"), (".lora_down.weight", "down"))
+
+
+def _group_lora_tensors(lora_state_dict: Dict[str, torch.Tensor]) -> Dict[str, Dict[str, torch.Tensor]]:
+    # one pass over the state dict: {base key: {"alpha": ..., "up": ..., "down": ...}}
+    groups = defaultdict(dict)
+    for key, param in lora_state_dict.items():
+        for suffix, name in _LORA_SUFFIXES:
+            if key.endswith(suffix):
+                groups[key[: -len(suffix)]][name] = param
+                break
+    return groups
+
 
 class FluxLoRAConverter(LoRAStateDictConverter):
     def _from_kohya(self, lora_state_dict: Dict[str, torch.Tensor]) -> Dict[str, Dict[str, torch.Tensor]]:
@@ -38,19 +120,15 @@ class FluxLoRAConverter(LoRAStateDictConverter):
 
         dit_dict = {}
         te_dict = {}
-        for key, param in lora_state_dict.items():
-            origin_key = key
-            if ".alpha" not in key:
+        for base_key, lora_tensors in _group_lora_tensors(lora_state_dict).items():
+            if "alpha" not in lora_tensors:
                 continue
+            key, param = base_key + ".alpha", lora_tensors["alpha"]
             if "lora_unet" in key:
                 key = key.replace("lora_unet_", "")
-                key = re.sub(r"(\d+)_", r"\1.", key)
-                key = re.sub(r"_(\d+)", r".\1", key)
-                key = key.replace("modulation_lin", "modulation.lin")
-                key = key.replace("mod_lin", "mod.lin")
-                key = key.replace("attn_qkv", "attn.qkv")
-                key = key.replace("attn_proj", "attn.proj")
-                key = key.replace(".alpha", ".weight")
+                key = _KOHYA_DIGIT_SUFFIX.sub(r"\1.", key)
+                key = _KOHYA_DIGIT_PREFIX.sub(r".\1", key)
+                key = _replace_all(_KOHYA_DIT_PATTERN, _KOHYA_DIT_REPLACEMENTS, key)
                 names = key.split(".")
                 if key in dit_rename_dict:
                     rename = dit_rename_dict[key]
@@ -65,15 +143,13 @@ class FluxLoRAConverter(LoRAStateDictConverter):
                         raise ValueError(f"Unsupported key: {key}")
                 lora_args = {}
                 lora_args["alpha"] = param
-                lora_args["up"] = lora_state_dict[origin_key.replace(".alpha", ".lora_up.weight")]
-                lora_args["down"] = lora_state_dict[origin_key.replace(".alpha", ".lora_down.weight")]
+                lora_args["up"] = lora_tensors["up"]
+                lora_args["down"] = lora_tensors["down"]
                 lora_args["rank"] = lora_args["up"].shape[1]
                 rename = rename.replace(".weight", "")
                 dit_dict[rename] = lora_args
             elif "lora_te" in key:
-                name = key.replace("lora_te1", "text_encoder")
-                name = name.replace("text_model_encoder_layers", "text_model.encoder.layers")
-                name = name.replace(".alpha", ".weight")
+                name = _replace_all(_KOHYA_TE_PATTERN, _KOHYA_TE_REPLACEMENTS, key)
                 rename = ""
                 if name in clip_rename_dict:
                     if name == "text_model.embeddings.position_embedding.weight":
@@ -87,8 +163,8 @@ class FluxLoRAConverter(LoRAStateDictConverter):
                     raise ValueError(f"Unsupported key: {key}")
                 lora_args = {}
                 lora_args["alpha"] = param
-                lora_args["up"] = lora_state_dict[origin_key.replace(".alpha", ".lora_up.weight")]
-                lora_args["down"] = lora_state_dict[origin_key.replace(".alpha", ".lora_down.weight")]
+                lora_args["up"] = lora_tensors["up"]
+                lora_args["down"] = lora_tensors["down"]
                 lora_args["rank"] = lora_args["up"].shape[1]
                 rename = rename.replace(".weight", "")
                 te_dict[rename] = lora_args
@@ -98,46 +174,22 @@ class FluxLoRAConverter(LoRAStateDictConverter):
 
     def _from_diffusers(self, lora_state_dict: Dict[str, torch.Tensor]) -> Dict[str, Dict[str, torch.Tensor]]:
         dit_dict = {}
-        for key, param in lora_state_dict.items():
-            origin_key = key
-            if ".alpha" not in key:
+        for base_key, lora_tensors in _group_lora_tensors(lora_state_dict).items():
+            if "alpha" not in lora_tensors:
                 continue
+            key, param = base_key + ".alpha", lora_tensors["alpha"]
             key = key.replace(".alpha", ".weight")
             key = key.replace("transformer.", "")
             if "single_transformer_blocks" in key:  # transformer.single_transformer_blocks.0.attn.to_k.weight
-                key = key.replace(
-                    "single_transformer_blocks", "single_blocks"
-                )  # single_transformer_blocks.0.attn.to_k.weight
-                key = key.replace("norm.linear", "modulation.lin")
-                key = key.replace("proj_out", "linear2")
-                key = key.replace("attn", "linear1")  # linear1 = [to_q, to_k, to_v, mlp]
-                key = key.replace("proj_mlp", "linear1.mlp")
+                key = _replace_all(_DIFFUSERS_SINGLE_PATTERN, _DIFFUSERS_SINGLE_REPLACEMENTS, key)
             elif "transformer_blocks" in key:
-                key = key.replace("transformer_blocks", "double_blocks")
-                key = key.replace("attn.add_k_proj", "txt_attn.qkv.to_k")
-                key = key.replace("attn.add_q_proj", "txt_attn.qkv.to_q")
-                key = key.replace("attn.add_v_proj", "txt_attn.qkv.to_v")
-                key = key.replace("attn.to_add_out", "txt_attn.qkv.to_out")
-                key = key.replace("attn.to_k", "img_attn.qkv.to_k")
-                key = key.replace("attn.to_q", "img_attn.qkv.to_q")
-                key = key.replace("attn.to_v", "img_attn.qkv.to_v")
-                key = key.replace("attn.to_out", "img_attn.qkv.to_out")
-                key = key.replace("ff.net", "img_mlp")
-                key = key.replace("ff_context.net", "txt_mlp")
-                key = key.replace("norm1.linear", "img_mod.lin")
-                key = key.replace("norm1_context.linear", "txt_mod.lin")
-                key = key.replace(".0.proj", ".0")
+                key = _replace_all(_DIFFUSERS_DOUBLE_PATTERN, _DIFFUSERS_DOUBLE_REPLACEMENTS, key)
             elif "context_embedder" in key:
                 key = key.replace("context_embedder", "txt_in")
             elif "x_embedder" in key and "_x_embedder" not in key:
                 key = key.replace("x_embedder", "img_in")
             elif "time_text_embed" in key:
-                key = key.replace("time_text_embed.", "")
-                key = key.replace("timestep_embedder", "time_in")
-                key = key.replace("guidance_embedder", "guidance_in")
-                key = key.replace("text_embedder", "vector_in")
-                key = key.replace("linear_1", "in_layer")
-                key = key.replace("linear_2", "out_layer")
+                key = _replace_all(_DIFFUSERS_TIME_TEXT_PATTERN, _DIFFUSERS_TIME_TEXT_REPLACEMENTS, key)
             elif "norm_out.linear" in key:
                 key = key.replace("norm_out.linear", "final_layer.adaLN_modulation.1")
             elif "proj_out" in key:
@@ -146,15 +198,15 @@ class FluxLoRAConverter(LoRAStateDictConverter):
                 raise ValueError(f"Unsupported key: {key}")
             lora_args = {}
             lora_args["alpha"] = param
-            lora_args["up"] = lora_state_dict[origin_key.replace(".alpha", ".lora_up.weight")]
-            lora_args["down"] = lora_state_dict[origin_key.replace(".alpha", ".lora_down.weight")]
+            lora_args["up"] = lora_tensors["up"]
+            lora_args["down"] = lora_tensors["down"]
             lora_args["rank"] = lora_args["up"].shape[1]
             key = key.replace(".weight", "")
             dit_dict[key] = lora_args
         return {"dit": dit_dict}
 
     def convert(self, lora_state_dict: Dict[str, torch.Tensor]) -> Dict[str, Dict[str, torch.Tensor]]:
-        key = list(lora_state_dict.keys())[0]
+        key = next(iter(lora_state_dict))
         if "lora_te" in key or "lora_unet" in key:
             return self._from_kohya(lora_state_dict)
         elif key.startswith("transformer"):
@@ -176,10 +228,10 @@ def calculate_shift(
 
 
 def accumulate(result, new_item):
+    # block outputs are stacked as (num_blocks, B, L, D), so one in-place add covers every block
     if result is None:
         return new_item
-    for i, item in enumerate(new_item):
-        result[i] += item
+    result.add_(new_item)
     return result
 
 
@@ -228,6 +280,8 @@ class FluxImagePipeline(BasePipeline):
         vae_tiled: bool = False,
         vae_tile_size: int = 256,
         vae_tile_stride: int = 256,
+        prompt_cache_size: int = 8,
+        deterministic_seed_on_cpu: bool = True,
         device: str = "cuda:0",
         dtype: torch.dtype = torch.bfloat16,
     ):
@@ -250,6 +304,14 @@ class FluxImagePipeline(BasePipeline):
         self.vae_encoder = vae_encoder
         self.use_cfg = use_cfg
         self.batch_cfg = batch_cfg
+        # (prompt, clip_skip) -> (prompt_emb, add_text_embeds), kept on cpu in lru order
+        self.prompt_cache_size = prompt_cache_size
+        self.deterministic_seed_on_cpu = deterministic_seed_on_cpu
+        self._prompt_cache: OrderedDict[Tuple[str, int], Tuple[torch.Tensor, torch.Tensor]] = OrderedDict()
+        # shape/value keyed image_ids, text_ids and guidance tensors, kept in lru order
+        self._extra_input_cache: OrderedDict[tuple, torch.Tensor] = OrderedDict()
+        # tokenizer name -> (pinned [B, max_length] input_ids staging buffer, event of its last upload)
+        self._input_ids_buffers: Dict[str, Tuple[torch.Tensor, torch.cuda.Event]] = {}
         self.model_names = [
             "text_encoder_1",
             "text_encoder_2",
@@ -285,14 +347,14 @@ class FluxImagePipeline(BasePipeline):
         if model_config.vae_path is None:
             model_config.vae_path = fetch_model("muse/flux_vae", revision="20241015120836", path="ae.safetensors")
 
-        logger.info(f"loading state dict from {model_config.dit_path} ...")
-        dit_state_dict = cls.load_model_checkpoint(model_config.dit_path, device="cpu", dtype=dtype)
-        logger.info(f"loading state dict from {model_config.clip_path} ...")
-        clip_state_dict = cls.load_model_checkpoint(model_config.clip_path, device="cpu", dtype=dtype)
-        logger.info(f"loading state dict from {model_config.t5_path} ...")
-        t5_state_dict = cls.load_model_checkpoint(model_config.t5_path, device="cpu", dtype=dtype)
-        logger.info(f"loading state dict from {model_config.vae_path} ...")
-        vae_state_dict = cls.load_model_checkpoint(model_config.vae_path, device="cpu", dtype=dtype)
+        # the four checkpoints are independent files, read them concurrently so that disk I/O overlaps
+        checkpoint_paths = [model_config.dit_path, model_config.clip_path, model_config.t5_path, model_config.vae_path]
+        with ThreadPoolExecutor(max_workers=len(checkpoint_paths)) as executor:
+            futures = []
+            for path in checkpoint_paths:
+                logger.info(f"loading state dict from {path} ...")
+                futures.append(executor.submit(cls.load_model_checkpoint, path, device="cpu", dtype=dtype))
+            dit_state_dict, clip_state_dict, t5_state_dict, vae_state_dict = [future.result() for future in futures]
 
         init_device = "cpu" if offload_mode else device
         tokenizer = CLIPTokenizer.from_pretrained(FLUX_TOKENIZER_1_CONF_PATH)
@@ -327,7 +389,13 @@ class FluxImagePipeline(BasePipeline):
             pipe.enable_sequential_cpu_offload()
         return pipe
 
+    def load_loras(self, lora_list: List[Tuple[str, float]], fused: bool = True, save_original_weight: bool = False):
+        # loras may patch the text encoders, cached prompt embeddings would be stale
+        self._prompt_cache.clear()
+        super().load_loras(lora_list, fused=fused, save_original_weight=save_original_weight)
+
     def unload_loras(self):
+        self._prompt_cache.clear()
         self.dit.unload_loras()
         self.text_encoder_1.unload_loras()
         self.text_encoder_2.unload_loras()
@@ -341,31 +409,108 @@ class FluxImagePipeline(BasePipeline):
     def denoising_model(self):
         return self.dit
 
-    def encode_prompt(self, prompt, clip_skip: int = 2):
-        input_ids = self.tokenizer(prompt, max_length=77)["input_ids"].to(device=self.device)
+    def encode_prompt(self, prompt: Union[str, List[str]], clip_skip: int = 2):
+        # both tokenizers pad to max_length, so a list of prompts runs through each text encoder in one forward
+        input_ids = self._input_ids_to_device("tokenizer", self.tokenizer(prompt, max_length=77)["input_ids"])
         _, add_text_embeds = self.text_encoder_1(input_ids, clip_skip=clip_skip)
 
-        input_ids = self.tokenizer_2(prompt, max_length=512)["input_ids"].to(device=self.device)
+        input_ids = self._input_ids_to_device("tokenizer_2", self.tokenizer_2(prompt, max_length=512)["input_ids"])
         prompt_emb = self.text_encoder_2(input_ids)
 
         return prompt_emb, add_text_embeds
 
+    def _input_ids_to_device(self, name: str, input_ids: torch.Tensor) -> torch.Tensor:
+        """
+        Upload input_ids through a reused pinned staging buffer, so the copy is asynchronous instead of a blocking
+        copy from pageable memory.
+        """
+        device = torch.device(self.device)
+        if device.type != "cuda":
+            return input_ids.to(device=device)
+        buffer, event = self._input_ids_buffers.get(name, (None, None))
+        if buffer is None or buffer.shape[0] < input_ids.shape[0] or buffer.shape[1:] != input_ids.shape[1:]:
+            buffer, event = torch.empty(input_ids.shape, dtype=input_ids.dtype, pin_memory=True), torch.cuda.Event()
+            self._input_ids_buffers[name] = (buffer, event)
+        else:
+            # the previous upload from this buffer may still be in flight
+            event.synchronize()
+        staging = buffer[: input_ids.shape[0]]
+        staging.copy_(input_ids)
+        input_ids = staging.to(device=device, non_blocking=True)
+        event.record(torch.cuda.current_stream(device))
+        return input_ids
+
+    def encode_prompt_with_cache(self, prompts: List[str], clip_skip: int = 2):
+        """
+        Encode prompts through an LRU cache of the last `prompt_cache_size` prompts. The text encoders are only
+        loaded and run for cache misses, all misses go through them in one batch.
+        """
+        embeds = {}
+        for prompt in prompts:
+            key = (prompt, clip_skip)
+            if key in self._prompt_cache:
+                self._prompt_cache.move_to_end(key)
+                embeds[prompt] = self._prompt_cache[key]
+        missing = [prompt for prompt in dict.fromkeys(prompts) if prompt not in embeds]
+        if len(missing) > 0:
+            self.load_models_to_device(["text_encoder_1", "text_encoder_2"])
+            prompt_emb, add_text_embeds = self.encode_prompt(missing, clip_skip=clip_skip)
+            for i, prompt in enumerate(missing):
+                embeds[prompt] = (prompt_emb[i : i + 1], add_text_embeds[i : i + 1])
+                if self.prompt_cache_size > 0:
+                    self._prompt_cache[(prompt, clip_skip)] = tuple(
+                        self._to_prompt_cache(emb) for emb in embeds[prompt]
+                    )
+            while len(self._prompt_cache) > self.prompt_cache_size:
+                self._prompt_cache.popitem(last=False)
+        prompt_emb = torch.cat([embeds[prompt][0].to(self.device, non_blocking=True) for prompt in prompts])
+        add_text_embeds = torch.cat([embeds[prompt][1].to(self.device, non_blocking=True) for prompt in prompts])
+        return prompt_emb, add_text_embeds
+
+    @staticmethod
+    def _to_prompt_cache(emb: torch.Tensor) -> torch.Tensor:
+        emb = emb.cpu()
+        # pinned memory lets cache hits go back to the gpu asynchronously
+        return emb.pin_memory() if torch.cuda.is_available() else emb
+
     def prepare_extra_input(self, latents, positive_prompt_emb, guidance=1.0):
-        image_ids = self.dit.prepare_image_ids(latents)
-        guidance = torch.tensor([guidance] * latents.shape[0], device=latents.device, dtype=latents.dtype)
-        text_ids = torch.zeros(positive_prompt_emb.shape[0], positive_prompt_emb.shape[1], 3).to(
-            device=self.device, dtype=positive_prompt_emb.dtype
+        # image_ids, text_ids and guidance only depend on shapes and values, they are never written to and can be
+        # shared across calls
+        batch_size, _, height, width = latents.shape
+        image_ids = self._get_extra_input(
+            ("image_ids", batch_size, height, width, latents.dtype, latents.device),
+            lambda: self.dit.prepare_image_ids(latents),
+        )
+        # text_ids are all zeros, one [1, S, 3] row is expanded to the batch as a view
+        prompt_batch_size, prompt_seq_len = positive_prompt_emb.shape[:2]
+        text_ids = self._get_extra_input(
+            ("text_ids", prompt_seq_len, positive_prompt_emb.dtype),
+            lambda: torch.zeros(1, prompt_seq_len, 3, device=self.device, dtype=positive_prompt_emb.dtype),
+        )
+        guidance = self._get_extra_input(
+            ("guidance", batch_size, guidance, latents.dtype, latents.device),
+            lambda: torch.full((batch_size,), guidance, device=latents.device, dtype=latents.dtype),
         )
-        return image_ids, text_ids, guidance
+        return image_ids, text_ids.expand(prompt_batch_size, -1, -1), guidance
+
+    def _get_extra_input(self, key: tuple, build: Callable[[], torch.Tensor]) -> torch.Tensor:
+        # every new resolution, prompt length or guidance value adds entries, keep only the recent ones
+        if key in self._extra_input_cache:
+            self._extra_input_cache.move_to_end(key)
+        else:
+            self._extra_input_cache[key] = build()
+            while len(self._extra_input_cache) > EXTRA_INPUT_CACHE_SIZE:
+                self._extra_input_cache.popitem(last=False)
+        return self._extra_input_cache[key]
 
     def predict_noise_with_cfg(
         self,
         latents: torch.Tensor,
         timestep: torch.Tensor,
         positive_prompt_emb: torch.Tensor,
-        negative_prompt_emb: torch.Tensor,
+        negative_prompt_emb: torch.Tensor | None,
         positive_add_text_embeds: torch.Tensor,
-        negative_add_text_embeds: torch.Tensor,
+        negative_add_text_embeds: torch.Tensor | None,
         image_emb: torch.Tensor | None,
         image_ids: torch.Tensor,
         text_ids: torch.Tensor,
@@ -376,6 +521,8 @@ class FluxImagePipeline(BasePipeline):
         total_step: int,
         use_cfg: bool = False,
         batch_cfg: bool = False,
+        batch_cfg_prompt_emb: torch.Tensor | None = None,
+        batch_cfg_add_text_embeds: torch.Tensor | None = None,
     ):
         if cfg_scale <= 1.0 or not use_cfg:
             return self.predict_noise(
@@ -422,9 +569,18 @@ class FluxImagePipeline(BasePipeline):
             noise_pred = negative_noise_pred + cfg_scale * (positive_noise_pred - negative_noise_pred)
             return noise_pred
         else:
-            # cfg by predict noise in one batch
-            prompt_emb = torch.cat([positive_prompt_emb, negative_prompt_emb], dim=0)
-            add_text_embeds = torch.cat([positive_add_text_embeds, negative_add_text_embeds], dim=0)
+            # cfg by predict noise in one batch, the caller may pass the [positive, negative] prompt batch it
+            # already built once instead of concatenating it again at every step
+            prompt_emb = (
+                batch_cfg_prompt_emb
+                if batch_cfg_prompt_emb is not None
+                else torch.cat([positive_prompt_emb, negative_prompt_emb], dim=0)
+            )
+            add_text_embeds = (
+                batch_cfg_add_text_embeds
+                if batch_cfg_add_text_embeds is not None
+                else torch.cat([positive_add_text_embeds, negative_add_text_embeds], dim=0)
+            )
             latents = torch.cat([latents, latents], dim=0)
             timestep = torch.cat([timestep, timestep], dim=0)
             positive_noise_pred, negative_noise_pred = self.predict_noise(
@@ -504,14 +660,15 @@ class FluxImagePipeline(BasePipeline):
             self.load_models_to_device(["vae_encoder"])
             noise = latents
             image = self.preprocess_image(input_image).to(device=self.device, dtype=self.dtype)
+            # add_noise and FlowMatchEulerSampler.step are out of place, so init_latents can alias latents
             latents = self.encode_image(image)
-            init_latents = latents.clone()
+            init_latents = latents
             latents = self.sampler.add_noise(latents, noise, sigma_start)
         else:
             sigmas, timesteps = self.noise_scheduler.schedule(
                 num_inference_steps, mu=mu, sigma_min=1 / num_inference_steps, sigma_max=1.0
             )
-            init_latents = latents.clone()
+            init_latents = latents
         sigmas, timesteps = sigmas.to(device=self.device), timesteps.to(self.device)
         return init_latents, latents, sigmas, timesteps
 
@@ -525,8 +682,8 @@ class FluxImagePipeline(BasePipeline):
             mask = mask.resize((width, height))
             image = self.preprocess_image(image).to(device=self.device, dtype=self.dtype)
             mask = self.preprocess_mask(mask).to(device=self.device, dtype=self.dtype)
-            masked_image = image.clone()
-            masked_image[(mask > 0.5).repeat(1, 3, 1, 1)] = -1
+            # the [1, 1, H, W] mask broadcasts over the channels, no repeated bool mask and no index scatter
+            masked_image = image.masked_fill(mask > 0.5, -1)
             latent = self.encode_image(masked_image)
             mask = torch.nn.functional.interpolate(mask, size=(latent.shape[2], latent.shape[3]))
             mask = 1 - mask
@@ -560,29 +717,81 @@ class FluxImagePipeline(BasePipeline):
         total_step: int,
     ):
         double_block_output_results, single_block_output_results = None, None
+        # controlnet params sharing one model (e.g. several conditions for the same controlnet) run as one batch
+        groups: Dict[int, List[ControlNetParams]] = {}
         for param in controlnet_params:
-            current_scale = param.scale
             if not (
                 current_step >= param.control_start * total_step and current_step <= param.control_end * total_step
             ):
                 # if current_step is not in the control range
                 # skip thie controlnet
                 continue
-            double_block_output, single_block_output = param.model(
-                latents,
-                param.image,
-                current_scale,
-                timestep,
-                prompt_emb,
-                add_text_embeds,
-                guidance,
-                image_ids,
-                text_ids,
-            )
+            groups.setdefault(id(param.model), []).append(param)
+        for group in groups.values():
+            if len(group) == 1:
+                double_block_output, single_block_output = group[0].model(
+                    latents,
+                    group[0].image,
+                    group[0].scale,
+                    timestep,
+                    prompt_emb,
+                    add_text_embeds,
+                    guidance,
+                    image_ids,
+                    text_ids,
+                )
+            else:
+                double_block_output, single_block_output = self.predict_batched_controlnet(
+                    group, latents, timestep, prompt_emb, add_text_embeds, guidance, image_ids, text_ids
+                )
             double_block_output_results = accumulate(double_block_output_results, double_block_output)
             single_block_output_results = accumulate(single_block_output_results, single_block_output)
         return double_block_output_results, single_block_output_results
 
+    @staticmethod
+    def predict_batched_controlnet(
+        group: List[ControlNetParams],
+        latents: torch.Tensor,
+        timestep: torch.Tensor,
+        prompt_emb: torch.Tensor,
+        add_text_embeds: torch.Tensor,
+        guidance: torch.Tensor,
+        image_ids: torch.Tensor,
+        text_ids: torch.Tensor,
+    ):
+        """
+        Run several conditions through the same controlnet in one forward. Inputs are stacked along the batch dim
+        (inputs with batch size 1 keep broadcasting), the per-block outputs are weighted by each condition's scale
+        and summed back to the original batch size.
+        """
+        num_groups, batch_size = len(group), latents.shape[0]
+
+        def repeat_batch(x: torch.Tensor) -> torch.Tensor:
+            return x.repeat(num_groups, *([1] * (x.dim() - 1))) if x.shape[0] == batch_size else x
+
+        images = torch.cat([param.image.expand(batch_size, -1, -1, -1) for param in group], dim=0)
+        double_block_output, single_block_output = group[0].model(
+            latents.repeat(num_groups, 1, 1, 1),
+            images,
+            1.0,
+            repeat_batch(timestep),
+            prompt_emb.repeat(num_groups, 1, 1),
+            add_text_embeds.repeat(num_groups, 1),
+            repeat_batch(guidance),
+            repeat_batch(image_ids),
+            repeat_batch(text_ids),
+        )
+        scales = torch.tensor([param.scale for param in group], device=latents.device, dtype=latents.dtype)
+
+        def reduce(outputs: torch.Tensor | None) -> torch.Tensor | None:
+            # (num_blocks, num_groups * B, ...) -> (num_blocks, B, ...)
+            if outputs is None:
+                return None
+            outputs = outputs.unflatten(1, (num_groups, batch_size))
+            return (outputs * scales.view(1, -1, *([1] * (outputs.dim() - 2)))).sum(dim=1)
+
+        return reduce(double_block_output), reduce(single_block_output)
+
     def enable_fp8_linear(self):
         enable_fp8_linear(self.dit)
 
@@ -618,9 +827,11 @@ class FluxImagePipeline(BasePipeline):
             controlnet_params = [controlnet_params]
         self.validate_image_size(height, width, minimum=64, multiple_of=16)
 
-        noise = self.generate_noise((1, 16, height // 8, width // 8), seed=seed, device="cpu", dtype=self.dtype).to(
-            device=self.device
-        )
+        # seeded noise is drawn on cpu by default so that a seed gives the same image on any device,
+        # unseeded noise has nothing to reproduce and is drawn on the device without an extra h2d copy
+        noise_device = "cpu" if seed is not None and self.deterministic_seed_on_cpu else self.device
+        noise = self.generate_noise((1, 16, height // 8, width // 8), seed=seed, device=noise_device, dtype=self.dtype)
+        noise = noise.to(device=self.device)
         # dynamic shift
         image_seq_len = math.ceil(height // 16) * math.ceil(width // 16)
         mu = calculate_shift(image_seq_len)
@@ -631,9 +842,16 @@ class FluxImagePipeline(BasePipeline):
         self.sampler.initialize(init_latents=init_latents, timesteps=timesteps, sigmas=sigmas)
 
         # Encode prompts
-        self.load_models_to_device(["text_encoder_1", "text_encoder_2"])
-        positive_prompt_emb, positive_add_text_embeds = self.encode_prompt(prompt, clip_skip=clip_skip)
-        negative_prompt_emb, negative_add_text_embeds = self.encode_prompt(negative_prompt, clip_skip=clip_skip)
+        prompt_emb, add_text_embeds = None, None
+        if cfg_scale > 1.0 and self.use_cfg:
+            # the [positive, negative] batch is reused as is by batch cfg at every step
+            prompt_emb, add_text_embeds = self.encode_prompt_with_cache([prompt, negative_prompt], clip_skip=clip_skip)
+            positive_prompt_emb, negative_prompt_emb = prompt_emb.chunk(2)
+            positive_add_text_embeds, negative_add_text_embeds = add_text_embeds.chunk(2)
+        else:
+            # predict_noise_with_cfg never reads the negative embeddings without cfg, skip the clip and t5 forward
+            positive_prompt_emb, positive_add_text_embeds = self.encode_prompt_with_cache([prompt], clip_skip=clip_skip)
+            negative_prompt_emb, negative_add_text_embeds = None, None
 
         # Extra input
         image_ids, text_ids, guidance = self.prepare_extra_input(latents, positive_prompt_emb, guidance=3.5)
@@ -648,8 +866,10 @@ class FluxImagePipeline(BasePipeline):
 
         # Denoise
         self.load_models_to_device(["dit"])
-        for i, timestep in enumerate(tqdm(timesteps)):
-            timestep = timestep.unsqueeze(0).to(dtype=self.dtype)
+        # cast once, every step then takes a [1] view instead of a fresh unsqueeze + cast
+        timesteps_typed = timesteps.to(dtype=self.dtype)
+        for i in tqdm(range(len(timesteps_typed))):
+            timestep = timesteps_typed[i : i + 1]
             noise_pred = self.predict_noise_with_cfg(
                 latents=latents,
                 timestep=timestep,
@@ -667,6 +887,8 @@ class FluxImagePipeline(BasePipeline):
                 total_step=len(timesteps),
                 use_cfg=self.use_cfg,
                 batch_cfg=self.batch_cfg,
+                batch_cfg_prompt_emb=prompt_emb,
+                batch_cfg_add_text_embeds=add_text_embeds,
             )
             # Denoise
             latents = self.sampler.step(latents, noise_pred, i)
@@ -1,23 +1,66 @@
 import os
+import json
+import email.message
+import glob
+import hashlib
+import fnmatch
+import queue
+import functools
+import itertools
+import threading
 import shutil
 import tqdm
 import tempfile
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 from urllib.parse import urlparse
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from modelscope import snapshot_download
+from modelscope import snapshot_download, model_file_download
 from modelscope.hub.api import HubApi
 from diffsynth_engine.utils import logging
 from diffsynth_engine.utils.lock import HeartbeatFileLock
 from diffsynth_engine.utils.env import DIFFSYNTH_FILELOCK_DIR, DIFFSYNTH_CACHE
 from diffsynth_engine.utils.constants import MB
+from diffsynth_engine.utils.flag import ORJSON_AVAILABLE
+
+if ORJSON_AVAILABLE:
+    import orjson
+
+    _json_loads = orjson.loads
+else:
+    _json_loads = json.loads
 
 logger = logging.get_logger(__name__)
 
 
 MODEL_SOURCES = ["modelscope", "civitai"]
+# civitai's cdn serves range requests, large files are fetched as parallel shards of this size
+RANGE_SHARD_SIZE = 8 * MB
+RANGE_NUM_WORKERS = 8
+PROGRESS_UPDATE_SIZE = 8 * MB
+DOWNLOAD_HEADERS = {"Accept-Encoding": "identity"}
+MODELSCOPE_NUM_WORKERS = 8
+# (connect, read) seconds for small api requests, the retries of _SESSION apply on top
+API_TIMEOUT = (10, 60)
+
+
+def _create_session() -> requests.Session:
+    # keep-alive connections are reused across the metadata requests, the download and its range shards
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504], raise_on_status=False)
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    return session
+
+
+_SESSION = _create_session()
+# (model_uri, revision, path, source, fetch_safetensors) -> local path resolved earlier in this process
+_FETCH_MODEL_CACHE: Dict[tuple, str] = {}
+# (model_id, revision) -> file paths in the modelscope repo, shared by all components fetched from one repo
+_MODELSCOPE_MANIFESTS: Dict[Tuple[str, Optional[str]], List[str]] = {}
 
 
 def fetch_model(
@@ -28,11 +71,19 @@ def fetch_model(
     source: str = "modelscope",
     fetch_safetensors: bool = True,
 ) -> str:
+    # the access token only grants access, the resolved local path does not depend on it
+    key = (model_uri, revision, path, source, fetch_safetensors)
+    result = _FETCH_MODEL_CACHE.get(key)
+    if result is not None and os.path.exists(result):
+        return result
     if source == "modelscope":
-        return fetch_modelscope_model(model_uri, revision, path, access_token, fetch_safetensors)
-    if source == "civitai":
-        return fetch_civitai_model(model_uri)
-    raise ValueError(f'source should be one of {MODEL_SOURCES} but got "{source}"')
+        result = fetch_modelscope_model(model_uri, revision, path, access_token, fetch_safetensors)
+    elif source == "civitai":
+        result = fetch_civitai_model(model_uri)
+    else:
+        raise ValueError(f'source should be one of {MODEL_SOURCES} but got "{source}"')
+    _FETCH_MODEL_CACHE[key] = result
+    return result
 
 
 def fetch_modelscope_model(
@@ -42,15 +93,29 @@ def fetch_modelscope_model(
     access_token: Optional[str] = None,
     fetch_safetensors: bool = True,
 ) -> str:
-    lock_file_name = f"modelscope.{model_id.replace('/', '--')}.{revision if revision else '__version'}.lock"
-    lock_file_path = os.path.join(DIFFSYNTH_FILELOCK_DIR, lock_file_name)
-    ensure_directory_exists(lock_file_path)
-    if access_token is not None:
-        api = HubApi()
-        api.login(access_token)
-    with HeartbeatFileLock(lock_file_path):
-        directory = os.path.join(DIFFSYNTH_CACHE, "modelscope", model_id, revision if revision else "__version")
-        dirpath = snapshot_download(model_id, revision=revision, local_dir=directory, allow_patterns=path)
+    directory = os.path.join(DIFFSYNTH_CACHE, "modelscope", model_id, revision if revision else "__version")
+    # double-checked: cached fetches never touch the lock, the check is repeated under the lock in case another
+    # process finished the download while we were waiting
+    if _is_modelscope_cached(model_id, revision, path, access_token, directory):
+        dirpath = directory
+    else:
+        lock_file_name = f"modelscope.{model_id.replace('/', '--')}.{revision if revision else '__version'}.lock"
+        lock_file_path = os.path.join(DIFFSYNTH_FILELOCK_DIR, lock_file_name)
+        ensure_directory_exists(lock_file_path)
+        if access_token is not None:
+            _login_modelscope(access_token)
+        with HeartbeatFileLock(lock_file_path):
+            if _is_modelscope_cached(model_id, revision, path, access_token, directory):
+                dirpath = directory
+            elif path is None:
+                dirpath = _download_modelscope_repo(model_id, revision, access_token, directory)
+                _mark_snapshot_complete(dirpath, revision)
+            elif _is_single_file(model_id, revision, path, access_token):
+                # one known file, fetch it directly instead of setting up a snapshot of the repo
+                model_file_download(model_id, path, revision=revision, local_dir=directory)
+                dirpath = directory
+            else:
+                dirpath = snapshot_download(model_id, revision=revision, local_dir=directory, allow_patterns=path)
 
     if path is not None:
         path = os.path.join(dirpath, path)
@@ -62,29 +127,157 @@ def fetch_modelscope_model(
     return path
 
 
-def fetch_civitai_model(model_url: str) -> str:
+# written after a full snapshot_download, so later fetches of the whole repo can skip the manifest requests
+SNAPSHOT_COMPLETE_FILE = ".complete"
+
+
+def _is_modelscope_cached(
+    model_id: str, revision: Optional[str], path: Optional[str], access_token: Optional[str], directory: str
+) -> bool:
+    if path is None:
+        return _is_snapshot_complete(directory, revision)
+    if os.path.isfile(os.path.join(directory, path)):
+        # single files are moved into place once complete, an existing file means downloaded, no repo listing needed
+        return True
+    # a directory may exist but be half downloaded, directories and globs are checked file by file
+    return _is_pattern_cached(model_id, revision, path, access_token, directory)
+
+
+def _is_single_file(model_id: str, revision: Optional[str], path: str, access_token: Optional[str]) -> bool:
+    # one file of the repo like "model.safetensors" or "LICENSE", not a glob pattern or a directory like "v1.0"
+    if any(c in path for c in "*?[") or path.endswith("/"):
+        return False
+    try:
+        return path in _get_modelscope_manifest(model_id, revision, access_token)
+    except Exception as e:
+        # without the file list, guess from the name
+        logger.warning(f"Failed to list files of {model_id}, guess whether {path} is a file from its name: {e}")
+        return os.path.splitext(path)[1] != ""
+
+
+def _download_modelscope_repo(model_id: str, revision: Optional[str], access_token: Optional[str], directory: str):
+    """
+    Download every repo file missing from `directory`, several at a time. Repos are mostly many small files (configs,
+    tokenizers) next to a few large ones, downloading them concurrently hides the per-file round-trips behind the
+    large transfers.
+
+    modelscope keeps temp files and cache metadata in the `local_dir` it downloads into, and makes no promise that
+    concurrent downloads into one `local_dir` are safe. So every file goes into a private staging directory of its
+    own, and only finished files are moved into `directory`, one at a time on the calling thread. If any file fails
+    nothing partial is left behind and the snapshot is not marked complete.
+    """
+    # a previous, different snapshot must not look complete while this one is being filled in
+    _unmark_snapshot_complete(directory)
+    try:
+        manifest = _get_modelscope_manifest(model_id, revision, access_token)
+    except Exception as e:
+        logger.warning(f"Failed to list files of {model_id}, fall back to snapshot_download: {e}")
+        return snapshot_download(model_id, revision=revision, local_dir=directory)
+    missing = [file for file in manifest if not os.path.exists(os.path.join(directory, file))]
+    os.makedirs(directory, exist_ok=True)
+    staging_root = tempfile.mkdtemp(dir=directory, prefix=".staging-")
+    try:
+        with ThreadPoolExecutor(max_workers=MODELSCOPE_NUM_WORKERS) as executor:
+            futures = {
+                file: executor.submit(
+                    model_file_download,
+                    model_id,
+                    file,
+                    revision=revision,
+                    local_dir=os.path.join(staging_root, str(i)),
+                )
+                for i, file in enumerate(missing)
+            }
+            try:
+                for file, future in futures.items():
+                    staged_path = future.result()
+                    filepath = os.path.join(directory, file)
+                    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                    os.replace(staged_path, filepath)
+            except BaseException:
+                for future in futures.values():
+                    future.cancel()
+                raise
+    finally:
+        shutil.rmtree(staging_root, ignore_errors=True)
+    return directory
+
+
+def _is_pattern_cached(
+    model_id: str, revision: Optional[str], pattern: str, access_token: Optional[str], directory: str
+) -> bool:
+    # path may be a glob or a directory, resolve it against the repo file list to see if everything is local
+    try:
+        manifest = _get_modelscope_manifest(model_id, revision, access_token)
+    except Exception as e:
+        logger.warning(f"Failed to list files of {model_id}, fall back to snapshot_download: {e}")
+        return False
+    prefix = pattern.rstrip("/") + "/"
+    matches = [file for file in manifest if fnmatch.fnmatch(file, pattern) or file.startswith(prefix)]
+    return len(matches) > 0 and all(os.path.exists(os.path.join(directory, file)) for file in matches)
+
+
+def _get_modelscope_manifest(model_id: str, revision: Optional[str], access_token: Optional[str]) -> List[str]:
+    key = (model_id, revision)
+    if key not in _MODELSCOPE_MANIFESTS:
+        api = _login_modelscope(access_token) if access_token is not None else HubApi()
+        kwargs = {"revision": revision} if revision else {}
+        files = api.get_model_files(model_id, recursive=True, use_cookies=access_token is not None, **kwargs)
+        # newer modelscope releases list only files and drop the "Type" key
+        _MODELSCOPE_MANIFESTS[key] = [file["Path"] for file in files if file.get("Type") != "tree"]
+    return _MODELSCOPE_MANIFESTS[key]
+
+
+def _is_snapshot_complete(directory: str, revision: Optional[str]) -> bool:
+    sentinel = os.path.join(directory, SNAPSHOT_COMPLETE_FILE)
+    if not os.path.isfile(sentinel):
+        return False
+    with open(sentinel, "r", encoding="utf-8") as f:
+        return f.read() == (revision if revision else "")
+
+
+def _unmark_snapshot_complete(directory: str):
+    sentinel = os.path.join(directory, SNAPSHOT_COMPLETE_FILE)
+    if os.path.exists(sentinel):
+        os.remove(sentinel)
+
+
+def _mark_snapshot_complete(directory: str, revision: Optional[str]):
+    with open(os.path.join(directory, SNAPSHOT_COMPLETE_FILE), "w", encoding="utf-8") as f:
+        f.write(revision if revision else "")
+
+
+@functools.lru_cache(maxsize=8)
+def _login_modelscope(access_token: str) -> HubApi:
+    # the login session is process-wide, one round-trip per token is enough
+    api = HubApi()
+    api.login(access_token)
+    return api
+
+
+def fetch_civitai_model(model_url: str, chunk_size: int = 1 * MB) -> str:
     """
     https://civitai.com/models/4384?modelVersionId=128713
     https://civitai.com/models/4384
     https://civitai.com/api/download/models/128713?type=Model&format=SafeTensor&size=pruned&fp=fp16
-    """
-    try:
-        requests.get("https://civitai.com", timeout=3)
-    except Exception:
-        raise ValueError("Failed to access Civitai, please check your network connection.")
 
+    `chunk_size` is the size of each read from the response stream.
+    """
     parsed_url = urlparse(model_url)
+    files = None
     if "/models/" in parsed_url.path:
         if parsed_url.query:
             model_version_id = parsed_url.query.split("=")[-1]
             download_url = f"https://civitai.com/api/download/models/{model_version_id}"
         else:
             model_id = parsed_url.path.split("/")[-1]
-            result = requests.get(
-                f"https://civitai.com/api/v1/models/{model_id}", headers={"Content-Type": "application/json"}
-            ).json()
-            model_version_id = result["modelVersions"][0]["id"]
-            download_url = result["modelVersions"][0]["downloadUrl"]
+            result = _get_civitai_json(f"https://civitai.com/api/v1/models/{model_id}")
+            model_version = result["modelVersions"][0]
+            model_version_id = model_version["id"]
+            download_url = model_version["downloadUrl"]
+            # the model info already lists the version's files, no second metadata request needed
+            if model_version.get("files"):
+                files = model_version["files"]
     elif "/api/download/models/" in parsed_url.path:
         model_version_id = parsed_url.path.split("/")[-1]
         download_url = model_url
@@ -92,41 +285,219 @@ def fetch_civitai_model(model_url: str) -> str:
         raise ValueError("Invalid Civitai model URL")
     CIVITAI_CACHE = os.path.join(DIFFSYNTH_CACHE, "civitai")
     ensure_directory_exists(CIVITAI_CACHE)
-    filename = requests.get(f"https://civitai.com/api/v1/model-versions/{model_version_id}").json()["files"][0]["name"]
+    if files is None:
+        files = _get_civitai_json(f"https://civitai.com/api/v1/model-versions/{model_version_id}")["files"]
+    filename = (_select_civitai_file(files) or files[0])["name"]
     filepath = os.path.join(CIVITAI_CACHE, filename)
 
     if os.path.exists(filepath):
         logger.info(f"File {filename} already exists, file path: {filepath}")
         return filepath
-    response = requests.get(
-        download_url, stream=True, timeout=4 * 60 * 60, headers={"Content-Type": "application/json"}
-    )  # 4h
+    # safetensors do not compress, ask the cdn not to gzip them
+    response = _SESSION.get(download_url, stream=True, timeout=4 * 60 * 60, headers=DOWNLOAD_HEADERS)  # 4h
     if response.status_code >= 400:
         raise RuntimeError(f"Download {filename} failed, please check the model url")
     total_bytes = int(response.headers.get("content-length", 0))
-    bar = tqdm.tqdm(desc=f"Download {filename}", total=total_bytes, unit="B", unit_divisor=1024, unit_scale=True)
-    with tempfile.NamedTemporaryFile() as f:
-        for chunk in response.iter_content(chunk_size=16 * MB):
-            if chunk:
-                f.write(chunk)
-                bar.update(len(chunk))
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        shutil.copy(f.name, filepath)
+    # download urls with type/format/size/fp queries may serve another variant than the primary file, take the hash
+    # of the file that is actually served
+    served_file = _select_civitai_file(files, _content_disposition_filename(response))
+    expected_sha256 = (served_file.get("hashes") or {}).get("SHA256") if served_file is not None else None
+    if expected_sha256 is None:
+        logger.warning(f"No sha256 found for the served file of {model_url}, skip integrity check")
+    bar = tqdm.tqdm(
+        desc=f"Download {filename}",
+        total=total_bytes,
+        unit="B",
+        unit_divisor=1024,
+        unit_scale=True,
+        mininterval=0.5,
+    )
+    # download next to the target file, so finishing is a rename instead of a second full copy
+    f = tempfile.NamedTemporaryFile(dir=os.path.dirname(filepath), suffix=".part", delete=False)
+    hasher = hashlib.sha256()
+    try:
+        with f:
+            if _supports_range_download(response, total_bytes):
+                # a single tcp stream is often congestion-window limited, several ranged streams are not
+                response.close()
+                _download_ranges(response.url, f.fileno(), total_bytes, bar, chunk_size, hasher)
+            else:
+                if total_bytes > 0 and "content-encoding" not in response.headers:
+                    _preallocate(f.fileno(), total_bytes)
+                # copy straight from the raw stream instead of going through the iter_content generator
+                response.raw.decode_content = True
+                _copy_stream(response.raw, f, bar, hasher, chunk_size)
+                # drop any preallocated tail a short response did not fill
+                f.truncate()
+            f.flush()
+            _drop_page_cache(f.fileno())
+        if expected_sha256 is not None and hasher.hexdigest() != expected_sha256.lower():
+            raise RuntimeError(f"Download {filename} failed, sha256 {hasher.hexdigest()} != {expected_sha256}")
+        os.replace(f.name, filepath)
+    except BaseException:
+        os.unlink(f.name)
+        raise
+    finally:
         bar.close()
     # 提示文件下载完成，并显示文件路径
     logger.info(f"Download {filename} completed, file path: {filepath}")
     return filepath
 
 
+def _select_civitai_file(files: List[Dict], served_name: Optional[str] = None) -> Optional[Dict]:
+    if served_name is not None:
+        return next((file for file in files if file.get("name") == served_name), None)
+    # without a served name, the primary file is the one behind the version's download url
+    return next((file for file in files if file.get("primary")), None)
+
+
+def _content_disposition_filename(response: requests.Response) -> Optional[str]:
+    content_disposition = response.headers.get("content-disposition")
+    if content_disposition is None:
+        return None
+    message = email.message.Message()
+    message["content-disposition"] = content_disposition
+    return message.get_filename()
+
+
+def _get_civitai_json(url: str):
+    # no separate reachability probe, a failing metadata request reports the network problem itself
+    try:
+        response = _SESSION.get(url, headers={"Content-Type": "application/json"}, timeout=API_TIMEOUT)
+    except (requests.ConnectionError, requests.Timeout):
+        raise ValueError("Failed to access Civitai, please check your network connection.")
+    return _json_loads(response.content)
+
+
+def _supports_range_download(response: requests.Response, total_bytes: int) -> bool:
+    return (
+        hasattr(os, "pwrite")
+        and total_bytes > RANGE_SHARD_SIZE
+        and response.headers.get("accept-ranges") == "bytes"
+        and "content-encoding" not in response.headers
+    )
+
+
+def _preallocate(fd: int, size: int):
+    # reserve the extents up front so the filesystem does not grow the file piecemeal while it is being written,
+    # fall back to a sparse file where fallocate is missing or unsupported by the filesystem
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, size)
+
+
+def _drop_page_cache(fd: int):
+    # the file is read once more when the model is loaded, keeping gigabytes of it in the page cache only evicts
+    # pages that are still useful. no fsync, linux starts writeback for dirty pages and drops the clean ones
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def _download_ranges(url: str, fd: int, total_bytes: int, bar: tqdm.tqdm, chunk_size: int, hasher):
+    _preallocate(fd, total_bytes)
+
+    def download_shard(start: int):
+        end = min(start + RANGE_SHARD_SIZE, total_bytes) - 1
+        with _SESSION.get(
+            url, stream=True, timeout=4 * 60 * 60, headers={**DOWNLOAD_HEADERS, "Range": f"bytes={start}-{end}"}
+        ) as r:
+            if r.status_code != 206:
+                raise RuntimeError(f"Range request for bytes {start}-{end} failed with status {r.status_code}")
+            offset = start
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                # positional writes, shards never overlap so threads can share the fd
+                view = memoryview(chunk)
+                while len(view) > 0:
+                    written = os.pwrite(fd, view, offset)
+                    view, offset = view[written:], offset + written
+        # one progress update per shard instead of one per chunk
+        bar.update(offset - start)
+        if offset != end + 1:
+            raise RuntimeError(f"Range request for bytes {start}-{end} ended early at byte {offset}")
+
+    with ThreadPoolExecutor(max_workers=RANGE_NUM_WORKERS) as executor:
+        futures = [executor.submit(download_shard, start) for start in range(0, total_bytes, RANGE_SHARD_SIZE)]
+        try:
+            for start, future in zip(range(0, total_bytes, RANGE_SHARD_SIZE), futures):
+                future.result()
+                # sha256 cannot be combined from per-shard digests, so shards are hashed in file order by reading
+                # them back once they are complete. this is an extra read, but from the page cache, not the disk
+                size = min(RANGE_SHARD_SIZE, total_bytes - start)
+                hasher.update(os.pread(fd, size, start))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def _copy_stream(src, f, bar: tqdm.tqdm, hasher, chunk_size: int):
+    writer = _ProgressWriter(f, bar, hasher)
+    try:
+        shutil.copyfileobj(src, writer, length=chunk_size)
+    finally:
+        writer.close()
+    # only after a complete read, a network error raised above must not be replaced by what the writer hit after it
+    writer.raise_if_failed()
+
+
+class _ProgressWriter:
+    """
+    Write target for shutil.copyfileobj. Chunks go through a bounded queue to a writer thread, so writing (and
+    hashing) one chunk overlaps with reading the next one from the socket.
+    """
+
+    def __init__(self, f, bar: tqdm.tqdm, hasher, max_pending: int = 4):
+        self.f = f
+        self.bar = bar
+        self.hasher = hasher
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.pending_bytes = 0
+        self.thread = threading.Thread(target=self._drain, daemon=True)
+        self.thread.start()
+
+    def _drain(self):
+        while (data := self.queue.get()) is not None:
+            if self.error is None:
+                try:
+                    self.f.write(data)
+                    self.hasher.update(data)
+                except BaseException as e:
+                    self.error = e
+
+    def write(self, data: bytes) -> int:
+        if self.error is not None:
+            raise self.error
+        self.queue.put(data)
+        # batch progress updates, tqdm takes a lock and may redraw on every call
+        self.pending_bytes += len(data)
+        if self.pending_bytes >= PROGRESS_UPDATE_SIZE:
+            self.bar.update(self.pending_bytes)
+            self.pending_bytes = 0
+        return len(data)
+
+    def close(self):
+        self.bar.update(self.pending_bytes)
+        self.pending_bytes = 0
+        self.queue.put(None)
+        self.thread.join()
+
+    def raise_if_failed(self):
+        if self.error is not None:
+            raise self.error
+
+
 def ensure_directory_exists(filename: str):
     Path(filename).parent.mkdir(parents=True, exist_ok=True)
 
 
 def _fetch_safetensors(dirpath: str) -> str:
-    all_safetensors = []
-    for filename in os.listdir(dirpath):
-        if filename.endswith(".safetensors"):
-            all_safetensors.append(os.path.join(dirpath, filename))
+    # iglob walks the directory lazily, only none, one or many matters so stop at the second match
+    all_safetensors = list(itertools.islice(glob.iglob(os.path.join(glob.escape(dirpath), "*.safetensors")), 2))
     if len(all_safetensors) == 1:
         logger.info(f"Fetch safetensors file {all_safetensors[0]}")
         return all_safetensors[0]
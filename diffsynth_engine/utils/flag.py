@@ -44,3 +44,19 @@ if SPARGE_ATTN_AVAILABLE:
     logger.info("Sparge attention is available")
 else:
     logger.info("Sparge attention is not available")
+
+
+# 量化
+BITSANDBYTES_AVAILABLE = importlib.util.find_spec("bitsandbytes") is not None
+if BITSANDBYTES_AVAILABLE:
+    logger.info("Bitsandbytes is available")
+else:
+    logger.info("Bitsandbytes is not available")
+
+
+# 其他
+ORJSON_AVAILABLE = importlib.util.find_spec("orjson") is not None
+if ORJSON_AVAILABLE:
+    logger.info("orjson is available")
+else:
+    logger.info("orjson is not available")
@@ -0,0 +1,53 @@
+import torch
+import torch.nn as nn
+from typing import Tuple
+
+from diffsynth_engine.utils.flag import BITSANDBYTES_AVAILABLE
+
+
+def enable_int8_linear(module: nn.Module, exclude: Tuple[str, ...] = ()):
+    """
+    Swap every floating point nn.Linear under `module` for a bitsandbytes int8 weight-only linear. This reaches the
+    attention projections and feed-forward layers of the DiTs (FluxDiT, SD3DiT, WanDiT) whatever their attention
+    class is called, linears whose qualified name starts with one of `exclude` are kept as they are.
+    Call it after LoRAs are fused, the original weights are dropped so fused LoRAs can not be unloaded afterwards.
+    """
+    if not BITSANDBYTES_AVAILABLE:
+        raise ImportError("bitsandbytes is required for int8 linear, please install it first")
+    import bitsandbytes as bnb
+
+    # snapshot the tree first, the children are replaced while walking it
+    for parent_name, parent in list(module.named_modules()):
+        for child_name, child in list(parent.named_children()):
+            name = f"{parent_name}.{child_name}" if parent_name else child_name
+            if (
+                not isinstance(child, nn.Linear)
+                or isinstance(child, bnb.nn.Linear8bitLt)
+                # avoid conversion for int weights like GGUF
+                or not torch.is_floating_point(child.weight.data)
+                # skip linears with unfused LoRA, they still need the floating point weight at runtime
+                or len(getattr(child, "_lora_dict", {})) > 0
+                or any(name.startswith(prefix) for prefix in exclude)
+            ):
+                continue
+            setattr(parent, child_name, _to_int8_linear(child))
+    setattr(module, "int8_linear_enabled", True)
+
+
+def _to_int8_linear(linear: nn.Linear) -> nn.Module:
+    import bitsandbytes as bnb
+
+    device = linear.weight.device
+    int8_linear = bnb.nn.Linear8bitLt(
+        linear.in_features,
+        linear.out_features,
+        bias=linear.bias is not None,
+        has_fp16_weights=False,
+        device="cpu",
+    )
+    state_dict = {"weight": linear.weight.data.cpu()}
+    if linear.bias is not None:
+        state_dict["bias"] = linear.bias.data.cpu()
+    int8_linear.load_state_dict(state_dict)
+    # weights are quantized to int8 when moved to cuda device
+    return int8_linear.to(device)
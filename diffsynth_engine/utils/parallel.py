@@ -314,7 +314,11 @@ def _worker_loop(
         traceback.print_exc()
         logger.error(f"Error in worker loop (rank {rank}): {e}")
     finally:
+        from diffsynth_engine.models.basic.attention import clear_long_attn_cache
+
         del module
+        # the cached layers hold the sequence parallel groups that are destroyed below
+        clear_long_attn_cache()
         torch.cuda.synchronize()
         torch.cuda.empty_cache()
         dist.destroy_process_group()
@@ -0,0 +1,18 @@
+import unittest
+import torch
+import torch.nn.functional as F
+
+from diffsynth_engine.models.basic.attention import attention
+from diffsynth_engine.utils.flag import SPARGE_ATTN_AVAILABLE
+from tests.common.test_case import TestCase
+
+
+class TestAttention(TestCase):
+    @unittest.skipUnless(SPARGE_ATTN_AVAILABLE and torch.cuda.is_available(), "sparge attention is not available")
+    def test_sparge_attn(self):
+        q, k, v = (torch.randn(1, 4096, 12, 128, device="cuda:0", dtype=torch.float16) for _ in range(3))
+        expect = attention(q, k, v, attn_impl="sdpa")
+        result = attention(q, k, v, attn_impl="sparge_attn")
+        self.assertEqual(result.shape, expect.shape)
+        similarity = F.cosine_similarity(result.flatten().float(), expect.flatten().float(), dim=0).item()
+        self.assertGreater(similarity, 0.98)
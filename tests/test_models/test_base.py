@@ -0,0 +1,28 @@
+import torch
+from unittest import mock
+
+from diffsynth_engine.models.wan.wan_text_encoder import WanTextEncoder
+from diffsynth_engine.models.wan.wan_image_encoder import WanImageEncoder
+from diffsynth_engine.models.wan.wan_vae import WanVideoVAE
+from tests.common.test_case import TestCase
+
+
+class TestFromStateDict(TestCase):
+    def build_without_load(self, model_cls):
+        # stop right before the state dict is assigned and return the freshly built model
+        with mock.patch.object(model_cls, "load_state_dict", autospec=True) as load_state_dict:
+            model_cls.from_state_dict({}, device="cpu", dtype=torch.bfloat16)
+        return load_state_dict.call_args.args[0]
+
+    def test_parameters_are_meta_before_assign(self):
+        # these models contain layers that ignore the device kwarg, the meta device context must still catch them
+        for model_cls in (WanTextEncoder, WanImageEncoder, WanVideoVAE):
+            with self.subTest(model_cls=model_cls.__name__):
+                model = self.build_without_load(model_cls)
+                self.assertTrue(all(param.is_meta for param in model.parameters()))
+                self.assertTrue(all(buffer.is_meta for buffer in model.buffers()))
+
+    def test_plain_tensors_stay_real(self):
+        model = self.build_without_load(WanVideoVAE)
+        self.assertFalse(model.mean.is_meta)
+        self.assertFalse(model.std.is_meta)
@@ -0,0 +1,47 @@
+import torch
+import torch.nn as nn
+
+from diffsynth_engine.models.basic import lora as lora_module
+from diffsynth_engine.models.basic.lora import LoRALinear
+from tests.common.test_case import TestCase
+
+
+class TestLoRALinearUnmerge(TestCase):
+    def setUp(self):
+        super().setUp()
+        lora_module._warn_inexact_unmerge.cache_clear()
+
+    def merge_and_clear(self, dtype: torch.dtype, save_original_weight: bool):
+        torch.manual_seed(0)
+        linear = LoRALinear.from_linear(nn.Linear(64, 64, dtype=dtype))
+        original_weight = linear.weight.detach().clone()
+        for name in ("lora_1", "lora_2"):
+            linear.add_frozen_lora(
+                name,
+                scale=1.0,
+                rank=4,
+                alpha=4,
+                up=torch.randn(64, 4),
+                down=torch.randn(4, 64),
+                device="cpu",
+                dtype=dtype,
+                save_original_weight=save_original_weight,
+            )
+        self.assertFalse(torch.equal(linear.weight, original_weight))
+        linear.clear()
+        return linear.weight.detach(), original_weight
+
+    def test_saved_weight_round_trip_is_exact(self):
+        weight, original_weight = self.merge_and_clear(torch.bfloat16, save_original_weight=True)
+        self.assertTrue(torch.equal(weight, original_weight))
+
+    def test_fp32_round_trip_without_saved_weight(self):
+        with self.assertNoLogs(lora_module.logger, level="WARNING"):
+            weight, original_weight = self.merge_and_clear(torch.float32, save_original_weight=False)
+        torch.testing.assert_close(weight, original_weight, atol=1e-5, rtol=0)
+
+    def test_bf16_round_trip_without_saved_weight_warns(self):
+        with self.assertLogs(lora_module.logger, level="WARNING") as logs:
+            self.merge_and_clear(torch.bfloat16, save_original_weight=False)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("save_original_weight=True", logs.output[0])
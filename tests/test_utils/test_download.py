@@ -0,0 +1,163 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from unittest import mock
+
+import requests
+
+from diffsynth_engine.utils import download
+from tests.common.test_case import TestCase
+
+
+class TestFetchModelscopeModel(TestCase):
+    model_id = "test/model"
+
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        for name, value in (
+            ("DIFFSYNTH_CACHE", os.path.join(tmp_dir.name, "cache")),
+            ("DIFFSYNTH_FILELOCK_DIR", os.path.join(tmp_dir.name, "lock")),
+        ):
+            patcher = mock.patch.object(download, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.directory = os.path.join(tmp_dir.name, "cache", "modelscope", self.model_id, "__version")
+        self.addCleanup(download._MODELSCOPE_MANIFESTS.clear)
+
+    def write_files(self, files, root=None):
+        for file in files:
+            filepath = os.path.join(root or self.directory, file)
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with open(filepath, "w") as f:
+                f.write(file)
+
+    def test_incomplete_directory_is_downloaded(self):
+        manifest = ["text_encoder/config.json", "text_encoder/model.safetensors"]
+        self.write_files(manifest[:1])
+        with (
+            mock.patch.object(download, "_get_modelscope_manifest", return_value=manifest),
+            mock.patch.object(download, "snapshot_download", return_value=self.directory) as snapshot_download,
+        ):
+            download.fetch_modelscope_model(self.model_id, path="text_encoder", fetch_safetensors=False)
+        snapshot_download.assert_called_once()
+
+    def test_complete_directory_is_not_downloaded(self):
+        manifest = ["text_encoder/config.json", "text_encoder/model.safetensors"]
+        self.write_files(manifest)
+        with (
+            mock.patch.object(download, "_get_modelscope_manifest", return_value=manifest),
+            mock.patch.object(download, "snapshot_download") as snapshot_download,
+        ):
+            path = download.fetch_modelscope_model(self.model_id, path="text_encoder", fetch_safetensors=False)
+        snapshot_download.assert_not_called()
+        self.assertEqual(path, os.path.join(self.directory, "text_encoder"))
+
+    def fake_model_file_download(self, failing_file=None):
+        def model_file_download(model_id, file_path, revision=None, local_dir=None):
+            # leave a partial file behind the way an interrupted download would, then fail
+            self.write_files([file_path], root=local_dir)
+            if file_path == failing_file:
+                raise RuntimeError(f"failed to download {file_path}")
+            return os.path.join(local_dir, file_path)
+
+        return model_file_download
+
+    def test_repo_download_marks_complete(self):
+        manifest = ["config.json", "text_encoder/model.safetensors"]
+        with (
+            mock.patch.object(download, "_get_modelscope_manifest", return_value=manifest),
+            mock.patch.object(download, "model_file_download", side_effect=self.fake_model_file_download()),
+        ):
+            path = download.fetch_modelscope_model(self.model_id, fetch_safetensors=False)
+        self.assertEqual(path, self.directory)
+        self.assertEqual(
+            sorted(os.listdir(self.directory)), [download.SNAPSHOT_COMPLETE_FILE, "config.json", "text_encoder"]
+        )
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, "text_encoder", "model.safetensors")))
+
+    def test_failed_repo_download_leaves_nothing_partial(self):
+        manifest = ["config.json", "text_encoder/model.safetensors"]
+        # a stale sentinel from an earlier snapshot must not survive a failed refresh
+        self.write_files([download.SNAPSHOT_COMPLETE_FILE])
+        fake_download = self.fake_model_file_download(failing_file="text_encoder/model.safetensors")
+        with (
+            mock.patch.object(download, "_get_modelscope_manifest", return_value=manifest),
+            mock.patch.object(download, "model_file_download", side_effect=fake_download),
+            self.assertRaises(RuntimeError),
+        ):
+            download.fetch_modelscope_model(self.model_id, fetch_safetensors=False)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, download.SNAPSHOT_COMPLETE_FILE)))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "text_encoder", "model.safetensors")))
+        self.assertEqual([name for name in os.listdir(self.directory) if name.startswith(".staging-")], [])
+
+    def test_dotted_directory_is_not_a_single_file(self):
+        manifest = ["v1.0/config.json", "v1.0/model.safetensors", "README"]
+        # half downloaded, the directory exists but one of its files is missing
+        self.write_files(manifest[:1])
+        with (
+            mock.patch.object(download, "_get_modelscope_manifest", return_value=manifest),
+            mock.patch.object(download, "model_file_download") as model_file_download,
+            mock.patch.object(download, "snapshot_download", return_value=self.directory) as snapshot_download,
+        ):
+            download.fetch_modelscope_model(self.model_id, path="v1.0", fetch_safetensors=False)
+        model_file_download.assert_not_called()
+        snapshot_download.assert_called_once()
+        self.assertEqual(snapshot_download.call_args.kwargs["allow_patterns"], "v1.0")
+
+    def test_extensionless_file_is_a_single_file(self):
+        manifest = ["v1.0/config.json", "v1.0/model.safetensors", "README"]
+        with (
+            mock.patch.object(download, "_get_modelscope_manifest", return_value=manifest),
+            mock.patch.object(download, "model_file_download") as model_file_download,
+            mock.patch.object(download, "snapshot_download") as snapshot_download,
+        ):
+            path = download.fetch_modelscope_model(self.model_id, path="README", fetch_safetensors=False)
+        model_file_download.assert_called_once_with(self.model_id, "README", revision=None, local_dir=self.directory)
+        snapshot_download.assert_not_called()
+        self.assertEqual(path, os.path.join(self.directory, "README"))
+
+
+class TestCopyStream(TestCase):
+    class FailingFile(io.BytesIO):
+        def __init__(self, wait_for: threading.Event = None):
+            super().__init__()
+            self.wait_for = wait_for
+
+        def write(self, data):
+            if self.wait_for is not None:
+                self.wait_for.wait(timeout=10)
+            raise OSError("disk full")
+
+    def copy_stream(self, src, f):
+        download._copy_stream(src, f, mock.MagicMock(), hashlib.sha256(), chunk_size=4)
+
+    def test_network_error_is_not_replaced_by_writer_error(self):
+        network_failed = threading.Event()
+
+        def read(size):
+            if read.calls == 0:
+                read.calls += 1
+                return b"data"
+            # the writer only fails once the read side has failed as well
+            network_failed.set()
+            raise requests.ConnectionError("connection reset")
+
+        read.calls = 0
+        src = mock.MagicMock(read=read)
+        with self.assertRaises(requests.ConnectionError):
+            self.copy_stream(src, self.FailingFile(wait_for=network_failed))
+
+    def test_writer_error_is_raised_after_complete_read(self):
+        with self.assertRaises(OSError):
+            self.copy_stream(io.BytesIO(b"data"), self.FailingFile())
+
+    def test_stream_is_copied_and_hashed(self):
+        f = io.BytesIO()
+        hasher = hashlib.sha256()
+        download._copy_stream(io.BytesIO(b"0123456789"), f, mock.MagicMock(), hasher, chunk_size=4)
+        self.assertEqual(f.getvalue(), b"0123456789")
+        self.assertEqual(hasher.hexdigest(), hashlib.sha256(b"0123456789").hexdigest())
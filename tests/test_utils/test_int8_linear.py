@@ -0,0 +1,38 @@
+import unittest
+import torch
+import torch.nn as nn
+
+from diffsynth_engine.models.flux.flux_dit import FluxJointAttention
+from diffsynth_engine.models.wan.wan_dit import DiTBlock
+from diffsynth_engine.utils.flag import BITSANDBYTES_AVAILABLE
+from diffsynth_engine.utils.int8_linear import enable_int8_linear
+from tests.common.test_case import TestCase
+
+
+@unittest.skipUnless(BITSANDBYTES_AVAILABLE, "bitsandbytes is not available")
+class TestEnableInt8Linear(TestCase):
+    def assert_linears_replaced(self, module: nn.Module):
+        import bitsandbytes as bnb
+
+        linears = [name for name, submodule in module.named_modules() if isinstance(submodule, nn.Linear)]
+        self.assertGreater(len(linears), 0)
+        enable_int8_linear(module)
+        for name, submodule in module.named_modules():
+            if name in linears:
+                self.assertIsInstance(submodule, bnb.nn.Linear8bitLt, name)
+
+    def test_dit_linears_are_replaced(self):
+        # the DiTs use their own attention classes, the swap must not depend on the Attention module
+        modules = {
+            "flux": FluxJointAttention(64, 64, num_heads=4, head_dim=16, device="cpu", dtype=torch.float32),
+            "wan": DiTBlock(False, 64, num_heads=4, ffn_dim=128, device="cpu", dtype=torch.float32),
+        }
+        for name, module in modules.items():
+            with self.subTest(model=name):
+                self.assert_linears_replaced(module)
+
+    def test_excluded_linears_are_kept(self):
+        module = FluxJointAttention(64, 64, num_heads=4, head_dim=16, device="cpu", dtype=torch.float32)
+        enable_int8_linear(module, exclude=("a_to_out",))
+        self.assertIs(type(module.a_to_out), nn.Linear)
+        self.assertIsNot(type(module.b_to_out), nn.Linear)